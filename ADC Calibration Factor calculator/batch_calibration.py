@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Calibrates a batch of boards from measured data.
+# Reads a CSV file of (board id, adc reading, reference voltage) samples, fits each board's
+# calibration factor by least squares and finds the best integer fraction for each board in
+# parallel using best_fraction() from voltagecallibration.py.
+# The results can be saved as a file of symbols for each board or as a small binary file for each
+# board that can be written to an EEPROM using EEPROMTools.py.
+# Created 19/10/2026
+
+import argparse
+import csv
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from voltagecallibration import best_fraction, picaxe_symbols, bit_depth, word_size, voltage_multiplier
+
+SAFE_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9 _.-]*") # Board ids that can be used as file names
+
+def read_samples(filename: str) -> dict:
+    """ Reads the CSV file into a dictionary of board id: list of (adc, voltage) tuples.
+    A header row is skipped if present. """
+    boards = {}
+    with open(filename, newline="") as file:
+        for line_number, row in enumerate(csv.reader(file), 1):
+            if len(row) == 0 or row[0].strip().startswith("#"):
+                continue
+            if len(row) < 3:
+                raise ValueError("Line {} of '{}' does not have a board id, adc reading and voltage".format(line_number, filename))
+            try:
+                adc = int(row[1])
+                voltage = float(row[2])
+            except ValueError:
+                if line_number == 1:
+                    continue # Header
+                raise ValueError("Line {} of '{}' has an invalid adc reading or voltage".format(line_number, filename))
+            boards.setdefault(row[0].strip(), []).append((adc, voltage))
+    return boards
+
+def fit_factor(samples, multiplier=voltage_multiplier) -> tuple:
+    """ Finds the calibration factor that minimises the squared error of adc * cf against the
+    measured voltage * multiplier. Returns the factor and the RMS error of the fit in units. """
+    sum_xy = sum(adc * voltage * multiplier for adc, voltage in samples)
+    sum_xx = sum(adc * adc for adc, _ in samples)
+    if sum_xx == 0:
+        raise ValueError("At least one sample with a non zero adc reading is needed")
+    cf = sum_xy / sum_xx
+    rms = math.sqrt(sum((adc * cf - voltage * multiplier)**2 for adc, voltage in samples) / len(samples))
+    return cf, rms
+
+def calibrate(boards: dict, multiplier=voltage_multiplier, metric="max", bit_depth=bit_depth,
+              word_size=word_size, workers=None) -> dict:
+    """ Fits and finds the best fraction for every board. Returns a dictionary of board id: result,
+    where each result is from best_fraction() with the fitted factor and fit error added. """
+    ids = sorted(boards)
+    fits = []
+    for board in ids:
+        try:
+            fits.append(fit_factor(boards[board], multiplier))
+        except ValueError as error:
+            raise ValueError("Board {}: {}".format(board, error))
+    search = partial(best_fraction, bit_depth=bit_depth, word_size=word_size, metric=metric)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fractions = list(pool.map(search, [cf for cf, _ in fits]))
+
+    results = {}
+    for board, (cf, rms), fraction in zip(ids, fits, fractions):
+        fraction["factor"] = cf
+        fraction["fit_rms_error"] = rms
+        fraction["samples"] = len(boards[board])
+        results[board] = fraction
+    return results
+
+def eeprom_patch(calibration) -> bytes:
+    """ Packs the numerator, offset and denominator as little endian words """
+    return b"".join(calibration[key].to_bytes(2, "little") for key in ("numerator", "offset", "denominator"))
+
+def write_symbols(filename, results, name) -> None:
+    """ Writes a file with the symbols for each board, one section per board """
+    with open(filename, "w") as file:
+        for board, calibration in results.items():
+            file.write("; Board {}: factor {:.6f}, max error {:.3f}\n".format(board, calibration["factor"], calibration["max_error"]))
+            file.write(picaxe_symbols(name, calibration))
+            file.write("\n\n")
+
+def write_patches(directory, results, address) -> None:
+    """ Writes a 6 byte binary file for each board to write into EEPROM at the given address.
+    Raises ValueError without writing anything if a board id is not safe to use as a file name. """
+    unsafe = [board for board in results if not SAFE_ID.fullmatch(board)]
+    if unsafe:
+        raise ValueError("Board ids can only contain letters, numbers, spaces, '_', '.' and '-' to be used as file names: {}".format(
+            ", ".join(repr(board) for board in unsafe)))
+    os.makedirs(directory, exist_ok=True)
+    for board, calibration in results.items():
+        filename = os.path.join(directory, "{}.bin".format(board))
+        with open(filename, "wb") as file:
+            file.write(eeprom_patch(calibration))
+    print("Upload each patch using: EEPROMTools.py w {} {} {}".format(address, address + 5, os.path.join(directory, "BOARD.bin")))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrates a batch of boards from measured adc readings and voltages.")
+    parser.add_argument("samples", help="CSV file with a board id, adc reading and reference voltage on each line")
+    parser.add_argument("--name", default="BATT", help="Symbol name, as in CAL_NAME_NUMERATOR (default BATT)")
+    parser.add_argument("--multiplier", type=float, default=voltage_multiplier, help="10 for 0.1V steps, 1 for whole volts...")
+    parser.add_argument("--metric", choices=["max", "rms"], default="max", help="Error to minimise over the adc range")
+    parser.add_argument("--bit-depth", type=int, default=bit_depth, help="ADC bits (10 for readadc10)")
+    parser.add_argument("--word-size", type=int, default=word_size, help="Bits before overflow")
+    parser.add_argument("--symbols", help="Save the symbols for each board to this file")
+    parser.add_argument("--eeprom", help="Save a binary patch for each board to this directory")
+    parser.add_argument("--address", type=int, default=0, help="EEPROM address the patches will be written to")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes to use")
+    args = parser.parse_args()
+
+    try:
+        boards = read_samples(args.samples)
+        print("Read {} samples for {} boards".format(sum(len(i) for i in boards.values()), len(boards)))
+        results = calibrate(boards, args.multiplier, args.metric, args.bit_depth, args.word_size, args.workers)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    print("{:>12} {:>8} {:>10} {:>8} {:>10} {:>10} {:>10}".format("Board", "Samples", "Factor", "Fit RMS", "N + O / D", "Max error", "RMS error"))
+    for board, calibration in results.items():
+        fraction = "{}+{}/{}".format(calibration["numerator"], calibration["offset"], calibration["denominator"])
+        print("{:>12} {:>8} {:>10.6f} {:>8.3f} {:>10} {:>10.3f} {:>10.3f}".format(
+            board, calibration["samples"], calibration["factor"], calibration["fit_rms_error"],
+            fraction, calibration["max_error"], calibration["rms_error"]))
+
+    if args.symbols:
+        write_symbols(args.symbols, results, args.name)
+        print("Saved symbols to '{}'".format(args.symbols))
+    if args.eeprom:
+        try:
+            write_patches(args.eeprom, results, args.address)
+        except ValueError as error:
+            parser.error(str(error))
+        print("Saved EEPROM patches to '{}'".format(args.eeprom))
+    if not args.symbols and not args.eeprom:
+        print()
+        for board, calibration in results.items():
+            print("; Board {}".format(board))
+            print(picaxe_symbols(args.name, calibration))
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# Generates lookup tables for converting ADC readings into units as an alternative to calculating
+# adc * numerator + offset / denominator at runtime.
+# Either a full table with an entry for every ADC reading or a piecewise linear table with an entry
+# every 2**n readings that is interpolated between can be generated. The conversion can be the
+# battery voltage or temperature conversion from voltagecallibration.py or any curve given as a CSV
+# file of (adc reading, value) points, such as a thermistor that cannot be done with a fraction.
+# The table can be output as table or lookup data for the program or as a binary EEPROM image that
+# can be uploaded with EEPROMTools.py.
+# Created 19/10/2026
+
+import argparse
+import csv
+
+import numpy as np
+
+from voltagecallibration import (battery_factor, temperature_factor, best_fraction, fraction_errors,
+                                 bit_depth, word_size)
+
+# Very rough time each part takes on a PICAXE M2 at 32MHz in microseconds. These are only meant for
+# comparing the approaches with each other, not as accurate times.
+STATEMENT_US = 40 # Fetching and decoding each command / let statement
+OPERATOR_US = {"+": 10, "-": 10, "*": 30, "/": 45, "%": 45}
+READTABLE_US = 40 # Per readtable of a single byte
+HI2CIN_US = 450 # Per hi2cin of a word from an external EEPROM at i2cslow_32
+
+LOOKUP_MAX = 256 # Most entries worth putting in a lookup command. Larger ones use up program memory
+
+def read_points(filename: str) -> tuple:
+    """ Reads a CSV file of (adc reading, value) points, skipping a header if present """
+    points = []
+    with open(filename, newline="") as file:
+        for line_number, row in enumerate(csv.reader(file), 1):
+            if len(row) < 2 or row[0].strip().startswith("#"):
+                continue
+            try:
+                points.append((float(row[0]), float(row[1])))
+            except ValueError:
+                if line_number != 1:
+                    raise ValueError("Line {} of '{}' is not a valid point".format(line_number, filename))
+    points.sort()
+    return np.array([p[0] for p in points]), np.array([p[1] for p in points])
+
+def ideal_values(conversion, count: int) -> np.ndarray:
+    """ Evaluates the conversion for readings 0 to count - 1. conversion is either a calibration
+    factor or a tuple of arrays of points to linearly interpolate between. """
+    adc = np.arange(count, dtype=np.float64)
+    if isinstance(conversion, tuple):
+        return np.interp(adc, conversion[0], conversion[1], left=None, right=None)
+    return adc * conversion
+
+def full_table(conversion, bit_depth=bit_depth) -> list:
+    """ Returns a table with the rounded value for every ADC reading """
+    return [int(v) for v in np.rint(ideal_values(conversion, 2**bit_depth))]
+
+def piecewise_table(conversion, step: int, bit_depth=bit_depth) -> list:
+    """ Returns a table with the rounded value every step readings, including one past the last
+    reading so that the last segment can be interpolated. step must be a power of 2. """
+    count = 2**bit_depth
+    if step < 1 or step & (step - 1) or step > count:
+        raise ValueError("The step must be a power of 2 no larger than {}".format(count))
+    # One point past the end is extrapolated from the last segment of the curve
+    adc = np.arange(0, count + 1, step)
+    values = ideal_values(conversion, count + 1)
+    if isinstance(conversion, tuple):
+        values[count] = 2 * values[count - 1] - values[count - 2]
+    return [int(v) for v in np.rint(values[adc])]
+
+def piecewise_results(table: list, step: int, bit_depth=bit_depth) -> np.ndarray:
+    """ Calculates what a PICAXE will get for every ADC reading using the interpolation code from
+    read_code(). Raises ValueError if the table cannot be used. """
+    adc = np.arange(2**bit_depth, dtype=np.int64)
+    bias = table_bias(table)
+    values = np.array(table, dtype=np.int64) + bias
+    if values.max() > 2**word_size - 1:
+        raise ValueError("The range of values in the table is too large to fit in a word")
+    low = values[adc // step]
+    high = values[adc // step + 1]
+    position = adc % step
+    increasing = np.all(np.diff(values) >= 0)
+    if not increasing and not np.all(np.diff(values) <= 0):
+        raise ValueError("Piecewise tables need the conversion to be only increasing or only decreasing")
+    difference = high - low if increasing else low - high
+    if (difference * position + step // 2).max() > 2**word_size - 1:
+        raise ValueError("The step is too large and interpolating would overflow")
+
+    change = (difference * position + step // 2) // step
+    return (low + change if increasing else low - change) - bias
+
+def table_bias(table: list) -> int:
+    """ Returns how much needs to be added to every entry so that none are negative. This is
+    subtracted again after reading the table, giving negative numbers in 2's complement. """
+    return max(0, -min(table))
+
+def check_range(table: list) -> None:
+    """ Raises ValueError if the values in the table cannot all be stored in a word """
+    if max(table) + table_bias(table) > 2**word_size - 1:
+        raise ValueError("The range of values in the table is too large to fit in a word")
+
+def entry_bytes(table: list) -> int:
+    """ Returns 1 if every value in the table fits in a byte, otherwise 2 """
+    return 1 if max(table) + table_bias(table) <= 255 else 2
+
+def errors(results: np.ndarray, ideal: np.ndarray) -> tuple:
+    """ Returns the maximum and RMS error """
+    error = np.abs(results - ideal)
+    return float(error.max()), float(np.sqrt(np.mean(error**2)))
+
+def fraction_time() -> int:
+    """ value = adc * N + O / D """
+    return STATEMENT_US + OPERATOR_US["*"] + OPERATOR_US["+"] + OPERATOR_US["/"]
+
+def full_time(width: int, eeprom: bool) -> int:
+    """ Reading one entry directly """
+    if eeprom:
+        # address = adc * 2 + START, then hi2cin
+        return 2 * STATEMENT_US + OPERATOR_US["*"] + OPERATOR_US["+"] + HI2CIN_US
+    if width == 1:
+        return STATEMENT_US + READTABLE_US # readtable adc, value
+    # address = adc * 2 + START, 2 x readtable, value = high * 256 + low
+    return 4 * STATEMENT_US + 2 * READTABLE_US + 2 * OPERATOR_US["*"] + 2 * OPERATOR_US["+"]
+
+def piecewise_time(width: int, eeprom: bool) -> int:
+    """ Reading two entries and interpolating between them """
+    # address calculation, position = adc % STEP, value = high - low * position + HALF / STEP + low
+    time = 3 * STATEMENT_US + OPERATOR_US["/"] + OPERATOR_US["*"] + OPERATOR_US["+"] + OPERATOR_US["%"]
+    time += OPERATOR_US["-"] + OPERATOR_US["*"] + 2 * OPERATOR_US["+"] + OPERATOR_US["/"]
+    if eeprom:
+        return time + STATEMENT_US + 2 * HI2CIN_US
+    # Each entry is read with one readtable per byte, plus inc address for words
+    return time + 2 * width * (STATEMENT_US + READTABLE_US) + (width - 1) * 2 * (STATEMENT_US + OPERATOR_US["*"] + OPERATOR_US["+"])
+
+def tradeoff_report(conversion, bit_depth=bit_depth, eeprom=False) -> list:
+    """ Compares the fraction with full and piecewise tables of every step size. Returns a list of
+    dictionaries with the name, bytes, max_error, rms_error and time of each approach. """
+    count = 2**bit_depth
+    ideal = ideal_values(conversion, count)
+    report = []
+
+    if not isinstance(conversion, tuple):
+        fraction = best_fraction(conversion, bit_depth=bit_depth)
+        max_error, rms_error = fraction_errors(conversion, fraction["numerator"], fraction["denominator"],
+                                               fraction["offset"], bit_depth)
+        report.append({"name": "Fraction {numerator} + {offset} / {denominator}".format(**fraction),
+                       "bytes": 0, "max_error": max_error, "rms_error": rms_error, "time": fraction_time()})
+
+    table = full_table(conversion, bit_depth)
+    try:
+        check_range(table)
+    except ValueError:
+        pass # Cannot be stored, so leave it out
+    else:
+        width = entry_bytes(table)
+        max_error, rms_error = errors(np.array(table), ideal)
+        report.append({"name": "Full table", "bytes": count * width, "max_error": max_error,
+                       "rms_error": rms_error, "time": full_time(width, eeprom)})
+
+    step = 2
+    while step <= count // 2:
+        table = piecewise_table(conversion, step, bit_depth)
+        try:
+            results = piecewise_results(table, step, bit_depth)
+        except ValueError:
+            break
+        width = entry_bytes(table)
+        max_error, rms_error = errors(results, ideal)
+        report.append({"name": "Piecewise, step {}".format(step), "bytes": len(table) * width,
+                       "max_error": max_error, "rms_error": rms_error, "time": piecewise_time(width, eeprom)})
+        step *= 2
+    return report
+
+def print_report(report: list) -> None:
+    """ Prints the trade off table """
+    if not report:
+        print("None of the tables can be stored, as the range of values is too large to fit in a word.")
+        return
+    fraction_us = report[0]["time"]
+    print("{:>32} {:>7} {:>10} {:>10} {:>9} {:>9}".format("Approach", "Bytes", "Max error", "RMS error", "Est. us", "Saving"))
+    for row in report:
+        print("{:>32} {:>7} {:>10.3f} {:>10.3f} {:>9} {:>8}%".format(
+            row["name"], row["bytes"], row["max_error"], row["rms_error"], row["time"],
+            round((fraction_us - row["time"]) / fraction_us * 100)))
+    print("Savings are compared to the {}.".format(report[0]["name"].lower()))
+
+def table_bytes(table: list, width: int) -> bytes:
+    """ Converts the table into bytes, with words stored little endian. Raises ValueError if the
+    values do not fit in a word. """
+    check_range(table)
+    bias = table_bias(table)
+    return b"".join((value + bias).to_bytes(width, "little") for value in table)
+
+def table_code(table: list, width: int, start: int) -> str:
+    """ Returns the table as a table directive """
+    data = ", ".join(str(b) for b in table_bytes(table, width))
+    return "table {}, ({})".format(start, data)
+
+def lookup_code(table: list, index="adc", result="value") -> str:
+    """ Returns the table as a lookup command. Only suitable for small tables (see LOOKUP_MAX). """
+    if len(table) > LOOKUP_MAX:
+        raise ValueError("A lookup of {} entries is too large. Use {} or fewer".format(len(table), LOOKUP_MAX))
+    check_range(table)
+    bias = table_bias(table)
+    return "lookup {}, ({}), {}".format(index, ", ".join(str(v + bias) for v in table), result)
+
+def read_code(width: int, start: int, step: int, eeprom: bool, increasing: bool = True, bias: int = 0) -> str:
+    """ Returns example code for reading the value for adc into value using lower, upper, position
+    and address as temporary word variables. For word entries, the _lsb and _msb bytes of value,
+    lower and upper need to have symbols as well. step is 1 for full tables. """
+    lines = []
+
+    def read_entry(target):
+        if eeprom:
+            if width == 2:
+                lines.append("hi2cin address, ({}_lsb, {}_msb)".format(target, target))
+            else:
+                lines.append("hi2cin address, ({})".format(target))
+        elif width == 2:
+            lines.append("readtable address, {}_lsb".format(target))
+            lines.append("inc address")
+            lines.append("readtable address, {}_msb".format(target))
+        else:
+            lines.append("readtable address, {}".format(target))
+
+    if step == 1:
+        lines.append("address = adc * {} + {}".format(width, start))
+        read_entry("value")
+    else:
+        lines.append("address = adc / {} * {} + {}".format(step, width, start))
+        read_entry("lower")
+        lines.append("address = address + {}".format(1 if width == 2 and not eeprom else width))
+        read_entry("upper")
+        lines.append("position = adc % {}".format(step))
+        if increasing:
+            lines.append("value = upper - lower * position + {} / {} + lower".format(step // 2, step))
+        else:
+            lines.append("value = lower - upper * position + {} / {}".format(step // 2, step))
+            lines.append("value = lower - value")
+
+    if bias:
+        lines.append("value = value - {} ; Negative values are in 2's complement".format(bias))
+    return "\n".join(lines)
+
+def power_of_two(text: str) -> int:
+    """ argparse type for --step """
+    value = int(text)
+    if value < 1 or value & (value - 1):
+        raise argparse.ArgumentTypeError("must be a power of 2 (1, 2, 4, 8...), not {}".format(value))
+    return value
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates lookup tables to convert adc readings into units.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--battery", action="store_true", help="Use the battery voltage conversion (default)")
+    source.add_argument("--temperature", action="store_true", help="Use the temperature conversion")
+    source.add_argument("--points", help="CSV file of (adc reading, value) points to interpolate between")
+    parser.add_argument("--bit-depth", type=int, default=bit_depth, help="ADC bits (10 for readadc10)")
+    parser.add_argument("--step", type=power_of_two, default=None, help="Readings between entries (power of 2), 1 for a full table. Only the report is shown if not given")
+    parser.add_argument("--format", choices=["table", "lookup", "eeprom"], default="table", help="How to output the table")
+    parser.add_argument("--start", type=int, default=0, help="Table or EEPROM address to start at")
+    parser.add_argument("--output", default="lookup.bin", help="File to save the EEPROM image to")
+    args = parser.parse_args()
+
+    if args.step is not None and args.step > 2**args.bit_depth:
+        parser.error("--step cannot be larger than the number of readings ({})".format(2**args.bit_depth))
+    if args.format == "lookup" and args.step is not None:
+        if args.step != 1:
+            parser.error("lookup can only be used with full tables (--step 1)")
+        if 2**args.bit_depth > LOOKUP_MAX:
+            parser.error("A full table has {} entries, which is too large for lookup (up to {}). Use --format table or eeprom, or a lower --bit-depth".format(
+                2**args.bit_depth, LOOKUP_MAX))
+
+    if args.points:
+        conversion = read_points(args.points)
+    elif args.temperature:
+        conversion = temperature_factor(bit_depth=args.bit_depth)
+    else:
+        conversion = battery_factor(bit_depth=args.bit_depth)
+
+    eeprom = args.format == "eeprom"
+    print("SIZE AND ACCURACY TRADE OFF:")
+    print_report(tradeoff_report(conversion, args.bit_depth, eeprom))
+    print("Times are very rough estimates at 32MHz{}.".format(", reading from an external EEPROM" if eeprom else ""))
+    print()
+
+    if args.step is not None:
+        if args.step == 1:
+            table = full_table(conversion, args.bit_depth)
+            try:
+                check_range(table)
+            except ValueError as error:
+                parser.error(str(error))
+        else:
+            table = piecewise_table(conversion, args.step, args.bit_depth)
+            try:
+                piecewise_results(table, args.step, args.bit_depth) # Check it can be used
+            except ValueError as error:
+                parser.error(str(error))
+        width = entry_bytes(table)
+        increasing = table[-1] >= table[0]
+        print("Table of {} entries, {} bytes each ({} bytes)".format(len(table), width, len(table) * width))
+
+        if args.format == "eeprom":
+            with open(args.output, "wb") as file:
+                file.write(table_bytes(table, width))
+            print("Saved to '{}'. Upload using: EEPROMTools.py w {} {} {}".format(
+                args.output, args.start, args.start + len(table) * width - 1, args.output))
+        elif args.format == "lookup":
+            print(lookup_code(table))
+        else:
+            if len(table) * width > 256:
+                print("; Warning: tables over 256 bytes may not fit in the table memory of some parts. Try --format eeprom")
+            print(table_code(table, width, args.start))
+
+        if args.format != "lookup":
+            print()
+            print("Example code to read it (adc, value, address, lower, upper and position are words):")
+            print(read_code(width, args.start, args.step, eeprom, increasing, table_bias(table)))
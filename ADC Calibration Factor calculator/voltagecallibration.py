@@ -7,6 +7,7 @@
 
 import math
 from fractions import Fraction
+import numpy as np
 
 # Use the excel spreadsheet to calculate the ideal values and select something near
 #
@@ -37,11 +38,12 @@ word_size = 16 # Number of bits to play around with before we start to get overf
 voltage_multiplier = 10 # 1 for whole Vs, 10 so 0.1V steps...
 temperature_multiplier = 10 # 1 for whole degrees, 10 for 0.1 degrees...
 
-def adc_to_volts(adc, numerator, denominator, integer_mode=True):
+def adc_to_volts(adc, numerator, denominator, integer_mode=True, offset=0, word_size=word_size):
     """ Tests out the callibration factor
     :param integer_mode: If true (default), uses integer division like uC, if False, floating point.
+    :param offset: Added before dividing (adc * numerator + offset / denominator on a PICAXE).
     """
-    tmp = adc * numerator
+    tmp = adc * numerator + offset
     if tmp > (2**word_size - 1):
         raise ValueError("Numerator is too high and would have allowed overflow")
 
@@ -70,51 +72,183 @@ def cf_to_fraction(cf, bit_depth=bit_depth, word_size=word_size):
     print("This is {:.4f}% off from the ideal calibration factor.".format(percentage_off))
 
     return cff
+
+def fraction_errors(cf, numerator, denominator, offset=0, bit_depth=bit_depth):
+    """ Returns the maximum and RMS error in units over every possible ADC reading when using
+    integer maths, compared to the ideal adc * cf. """
+    adc = np.arange(2**bit_depth, dtype=np.int64)
+    result = (adc * numerator + offset) // denominator
+    error = np.abs(result - adc * cf)
+    return float(error.max()), float(np.sqrt(np.mean(error**2)))
+
+def best_fraction(cf, bit_depth=bit_depth, word_size=word_size, metric="max", shift_only=False):
+    """ Exhaustively searches every numerator and denominator that cannot overflow word_size for the
+    one with the lowest error over the whole ADC range. Both no offset and a rounding offset of half
+    the denominator are tried.
+    :param metric: "max" to minimise the worst case error, "rms" to minimise the RMS error.
+    :param shift_only: Only try denominators that are powers of 2 (can be done with a right shift
+                       on parts that support it, which is quicker than a divide).
+    Returns a dictionary with the numerator, denominator, offset, shift (None if the denominator is
+    not a power of 2), max_error and rms_error.
+    """
+    adc = np.arange(2**bit_depth, dtype=np.int64)
+    ideal = adc * cf
+    max_word = 2**word_size - 1
+    max_numerator = max_word // (2**bit_depth - 1)
+    if shift_only:
+        denominators = 2**np.arange(word_size, dtype=np.int64)
+    else:
+        # Anything much larger than this would need a numerator that overflows
+        denominators = np.arange(1, math.ceil(2 * max_numerator / cf) + 2, dtype=np.int64)
+
+    # The error of the integer result is never more than 1 less than the error of the straight line
+    # a * numerator / denominator + offset / denominator, which can be calculated quickly. This is
+    # used to skip denominators that cannot beat the best found so far.
+    adc_max = float(adc[-1])
+    adc_mean = float(adc.mean())
+    adc_squared_mean = float(np.mean(adc.astype(np.float64)**2))
+
+    best = None
+    best_score = math.inf
+
+    def try_candidates(numerator, denominator_list, offsets):
+        """ Evaluates the candidates and updates the best if one of them is better """
+        nonlocal best, best_score
+        # Every candidate is checked at once. Rows are candidates, columns ADC readings.
+        numerator = np.asarray(numerator).reshape(-1, 1)
+        results = (adc * numerator + offsets[:, np.newaxis]) // denominator_list[:, np.newaxis]
+        error = np.abs(results - ideal)
+        if metric == "rms":
+            scores = np.sqrt(np.mean(error**2, axis=1))
+        else:
+            scores = error.max(axis=1)
+
+        index = int(np.argmin(scores))
+        if scores[index] < best_score:
+            best_score = scores[index]
+            best = (int(numerator[index % len(numerator), 0]), int(denominator_list[index]), int(offsets[index]))
+
+    # Start with the closest denominator to each numerator so that most can be skipped straight away
+    if not shift_only:
+        numerators = np.arange(1, max_numerator + 1, dtype=np.int64)
+        closest = np.clip(np.rint(numerators / cf).astype(np.int64), 1, None)
+        for offsets in (np.zeros_like(closest), closest // 2):
+            fits = adc[-1] * numerators + offsets <= max_word
+            if fits.any():
+                try_candidates(numerators[fits], closest[fits], offsets[fits])
+
+    for all_offsets in (np.zeros_like(denominators), denominators // 2):
+        for numerator in range(1, max_numerator + 1):
+            slope = numerator / denominators - cf
+            intercept = all_offsets / denominators
+            if metric == "rms":
+                bound = np.sqrt(np.maximum(slope**2 * adc_squared_mean + 2 * slope * intercept * adc_mean + intercept**2, 0)) - 1
+            else:
+                bound = np.maximum(np.abs(slope * adc_max + intercept), np.abs(intercept)) - 1
+            check = (adc_max * numerator + all_offsets <= max_word) & (bound < best_score)
+            if not check.any():
+                continue
+
+            try_candidates(numerator, denominators[check], all_offsets[check])
+
+    numerator, denominator, offset = best
+    max_error, rms_error = fraction_errors(cf, numerator, denominator, offset, bit_depth)
+    shift = denominator.bit_length() - 1 if denominator & (denominator - 1) == 0 else None
+    return {
+        "numerator": numerator,
+        "denominator": denominator,
+        "offset": offset,
+        "shift": shift,
+        "max_error": max_error,
+        "rms_error": rms_error
+    }
+
+def print_search(cf, cff, multiplier, metric="max"):
+    """ Compares limit_denominator() with the exhaustive search and returns the best result """
+    max_error, rms_error = fraction_errors(cf, cff.numerator, cff.denominator)
+    print("limit_denominator() fraction: max error {:.3f}, RMS error {:.3f} (x{})".format(max_error, rms_error, multiplier))
+    best = best_fraction(cf, metric=metric)
+    print("Best fraction found: ({} * adc + {}) / {}: max error {:.3f}, RMS error {:.3f}".format(
+        best["numerator"], best["offset"], best["denominator"], best["max_error"], best["rms_error"]))
+    shifted = best_fraction(cf, metric=metric, shift_only=True)
+    print("Best power of 2 denominator: ({} * adc + {}) >> {}: max error {:.3f}, RMS error {:.3f}".format(
+        shifted["numerator"], shifted["offset"], shifted["shift"], shifted["max_error"], shifted["rms_error"]))
+    print("(>> is only available on X2 parts. Use / {} on other parts)".format(shifted["denominator"]))
+    return best
     
-# Calculate the calibration factor for the battery voltage
-print("BATTERY VOLTAGE:")
-cf = voltage_multiplier * adc_ref * (r1 + r2) / ((2**bit_depth - 1) * r2) # When multiplied by adc, will obtain the voltage in 0.1V increments
-print("Voltage calibration factor is: {}".format(cf))
-cff = cf_to_fraction(cf)
-
-# Check the minimum steps.
-resolution = adc_to_volts(1, cff.numerator, cff.denominator, False) / voltage_multiplier
-print("The minimum adc voltage resolution is: {:.4f}V".format(resolution))
-
-# Check the maximum is not over
-maximum = adc_to_volts(2**bit_depth - 1, cff.numerator, cff.denominator) / voltage_multiplier
-print("Maximum measurable: {}V\n".format(maximum))
-
-
-
-# Calculate the cabibration factor for the temperature
-print("TEMPERATURE:")
-tf = temperature_multiplier * adc_ref * 100 / (2**bit_depth -1)
-print("Temperature calibration factor is: {}".format(tf))
-tff = cf_to_fraction(tf)
-
-# Check the minimum steps.
-resolution = adc_to_volts(1, tff.numerator, tff.denominator, False) / temperature_multiplier
-print("The minimum adc temperature resolution is: {:.4f}C".format(resolution))
-
-# Check the maximum is not over
-maximum = adc_to_volts(2**bit_depth - 1, tff.numerator, tff.denominator) / temperature_multiplier
-print("Maximum measurable: {}C\n".format(maximum))
-
-
-
-# Display the callibration factor
-print()
-print()
-print("If this all looks reasonable, then copy the following into the code:")
-print("For Picaxe microcontrollers:")
-print("symbol CAL_BATT_NUMERATOR = {}".format(cff.numerator))
-print("symbol CAL_BATT_DENOMINATOR = {}".format(cff.denominator))
-print("symbol CAL_TEMP_NUMERATOR = {}".format(tff.numerator))
-print("symbol CAL_TEMP_DENOMINATOR = {}".format(tff.denominator))
-print()
-print("For Arduino microcontrollers:")
-print("#define CAL_BATT_NUMERATOR {}".format(cff.numerator))
-print("#define CAL_BATT_DENOMINATOR {}".format(cff.denominator))
-print("#define CAL_TEMP_NUMERATOR {}".format(tff.numerator))
-print("#define CAL_TEMP_DENOMINATOR {}".format(tff.denominator))
+def battery_factor(r1=r1, r2=r2, adc_ref=adc_ref, bit_depth=bit_depth, multiplier=voltage_multiplier):
+    """ Calculates the ideal calibration factor for the voltage divider. When multiplied by the adc
+    reading, this gives the battery voltage in 1/multiplier V increments. """
+    return multiplier * adc_ref * (r1 + r2) / ((2**bit_depth - 1) * r2)
+
+def temperature_factor(adc_ref=adc_ref, bit_depth=bit_depth, multiplier=temperature_multiplier):
+    """ Calculates the ideal calibration factor for a 10mV/C temperature sensor """
+    return multiplier * adc_ref * 100 / (2**bit_depth - 1)
+
+def picaxe_symbols(name, calibration):
+    """ Returns the symbol lines for a result from best_fraction() """
+    return "\n".join([
+        "symbol CAL_{}_NUMERATOR = {}".format(name, calibration["numerator"]),
+        "symbol CAL_{}_OFFSET = {}".format(name, calibration["offset"]),
+        "symbol CAL_{}_DENOMINATOR = {}".format(name, calibration["denominator"])
+    ])
+
+def arduino_defines(name, calibration):
+    """ Returns the #define lines for a result from best_fraction() """
+    return "\n".join([
+        "#define CAL_{}_NUMERATOR {}".format(name, calibration["numerator"]),
+        "#define CAL_{}_OFFSET {}".format(name, calibration["offset"]),
+        "#define CAL_{}_DENOMINATOR {}".format(name, calibration["denominator"])
+    ])
+
+def main():
+    # Calculate the calibration factor for the battery voltage
+    print("BATTERY VOLTAGE:")
+    cf = battery_factor() # When multiplied by adc, will obtain the voltage in 0.1V increments
+    print("Voltage calibration factor is: {}".format(cf))
+    cff = cf_to_fraction(cf)
+
+    # Check the minimum steps.
+    resolution = adc_to_volts(1, cff.numerator, cff.denominator, False) / voltage_multiplier
+    print("The minimum adc voltage resolution is: {:.4f}V".format(resolution))
+
+    # Check the maximum is not over
+    maximum = adc_to_volts(2**bit_depth - 1, cff.numerator, cff.denominator) / voltage_multiplier
+    print("Maximum measurable: {}V".format(maximum))
+    cfb = print_search(cf, cff, voltage_multiplier)
+    print()
+
+
+
+    # Calculate the cabibration factor for the temperature
+    print("TEMPERATURE:")
+    tf = temperature_factor()
+    print("Temperature calibration factor is: {}".format(tf))
+    tff = cf_to_fraction(tf)
+
+    # Check the minimum steps.
+    resolution = adc_to_volts(1, tff.numerator, tff.denominator, False) / temperature_multiplier
+    print("The minimum adc temperature resolution is: {:.4f}C".format(resolution))
+
+    # Check the maximum is not over
+    maximum = adc_to_volts(2**bit_depth - 1, tff.numerator, tff.denominator) / temperature_multiplier
+    print("Maximum measurable: {}C".format(maximum))
+    tfb = print_search(tf, tff, temperature_multiplier)
+    print()
+
+
+
+    # Display the callibration factor
+    print()
+    print()
+    print("If this all looks reasonable, then copy the following into the code:")
+    print("For Picaxe microcontrollers (use as adc * CAL_NUMERATOR + CAL_OFFSET / CAL_DENOMINATOR):")
+    print(picaxe_symbols("BATT", cfb))
+    print(picaxe_symbols("TEMP", tfb))
+    print()
+    print("For Arduino microcontrollers (use as (adc * CAL_NUMERATOR + CAL_OFFSET) / CAL_DENOMINATOR):")
+    print(arduino_defines("BATT", cfb))
+    print(arduino_defines("TEMP", tfb))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Python tools in this repository using generated workloads, so that performance
+work can be shown to help and regressions can be caught.
+
+Each benchmark is run several times and the median time is recorded along with the peak memory.
+The benchmarks take turns so that a patch where the computer was busy slows a few runs of each one
+instead of every run of one of them.
+Tools that do their work when run (picaxe.py and variable_count.py, which use module level globals)
+are run as separate processes and their peak memory is the largest resident set size of the
+process. Everything else is run in this process and its peak memory is what tracemalloc saw
+allocated while it ran once more after being timed.
+
+Results can be saved as a baseline. Later runs are compared with the baseline and the exit code is
+1 if any benchmark got slower or used more memory than the thresholds allow. Times are compared
+directly, so save the baseline on the same computer when it is not busy with anything else.
+
+Usage:
+    ./benchmark.py --save            # Record a baseline on this computer
+    ./benchmark.py                   # Compare with it after making changes
+    ./benchmark.py --only eeprom     # Only the benchmarks with eeprom in their name
+
+Created 19/10/2026
+https://github.com/jgOhYeah/PICAXE-Libraries-Extras
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+BASELINE_VERSION = 1
+BYTE_VARIABLES = 28
+SAMPLE_SECONDS = 0.1
+
+
+class Skip(Exception):
+    """ Raised when a benchmark cannot run here (missing module, no pseudo terminals...) """
+
+
+def tool(*path: str) -> str:
+    """ Returns the path to something in the repository """
+    return os.path.join(REPOSITORY, *path)
+
+
+def use_tool(directory: str, module: str):
+    """ Imports a tool from its folder in the repository """
+    import importlib
+    path = tool(directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    try:
+        return importlib.import_module(module)
+    except ImportError as error:
+        raise Skip("{} needs {}".format(module, error.name))
+
+
+# Workloads
+def make_program(directory: str, files: int, subroutines: int, seed: int = 1) -> str:
+    """ Generates a program split over an include tree with a large call graph. Each file includes
+    up to 2 others and each subroutine has a contract comment and calls later subroutines (so there
+    is no recursion). Returns the main file. """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, "lib"), exist_ok=True)
+    names = ["var{}".format(i) for i in range(BYTE_VARIABLES - 4)]
+    labels = ["sub_{}_{}".format(file, sub) for file in range(files) for sub in range(subroutines)]
+
+    with open(os.path.join(directory, "lib", "symbols.basinc"), "w") as file:
+        for i, name in enumerate(names):
+            file.write("symbol {} = b{}\n".format(name, i))
+        file.write("symbol counter = w12\nsymbol LIMIT = 10\n")
+
+    for number in range(files):
+        lines = ["; Generated library {}".format(number)]
+        for child in (number * 2 + 1, number * 2 + 2):
+            if child < files:
+                lines.append('#INCLUDE "lib/file{}.basinc"'.format(child))
+        for sub in range(subroutines):
+            index = number * subroutines + sub
+            label = labels[index]
+            lines += ["", "{}:".format(label), "\t; Generated subroutine", "\t;",
+                      "\t; Variables read: {}".format(rng.choice(names)),
+                      "\t; Variables modified: {}".format(", ".join(rng.sample(names, 3))),
+                      "\t; Maximum stack depth used: {}".format(rng.randint(0, 4))]
+            for _ in range(rng.randint(4, 12)):
+                kind = rng.random()
+                a, b, c = rng.sample(names, 3)
+                if kind < 0.4:
+                    lines.append("\t{} = {} + {} * {}".format(a, b, c, rng.randint(1, 9)))
+                elif kind < 0.55 and index + 1 < len(labels):
+                    lines.append("\tgosub {}".format(labels[rng.randint(index + 1, min(index + 40, len(labels) - 1))]))
+                elif kind < 0.7:
+                    lines += ["\tif {} > {} then".format(a, rng.randint(0, 200)), "\t\t{} = {}".format(b, c),
+                              "\telse", "\t\tinc {}".format(b), "\tendif"]
+                elif kind < 0.85:
+                    lines += ["\tfor counter = 1 to LIMIT", "\t\t{} = {} ^ counter".format(a, b), "\tnext counter"]
+                else:
+                    lines.append('\tsertxd("{} ", #{}, cr, lf)'.format(label, a))
+            lines.append("\treturn")
+        with open(os.path.join(directory, "lib", "file{}.basinc".format(number)), "w") as file:
+            file.write("\n".join(lines) + "\n")
+
+    main = os.path.join(directory, "main.bas")
+    with open(main, "w") as file:
+        file.write('#PICAXE 08M2\n#INCLUDE "lib/symbols.basinc"\n\nmain:\n')
+        for label in labels[::subroutines]:
+            file.write("\tgosub {}\n".format(label))
+        file.write('\tgoto main\n\n#INCLUDE "lib/file0.basinc"\n')
+    return main
+
+
+def flatten(main: str, destination: str) -> None:
+    """ Writes the program as a single file without directives, like compiled_slot1.bas from the
+    PICAXE Programming Editor """
+    directory = os.path.dirname(main)
+    with open(destination, "w") as output:
+        def copy(filename):
+            with open(filename) as file:
+                for line in file:
+                    if line.upper().startswith("#INCLUDE"):
+                        copy(os.path.join(directory, line.split('"')[1]))
+                    elif not line.startswith("#"):
+                        output.write(line)
+        copy(main)
+
+
+def make_eeprom_image(size: int, seed: int = 1) -> bytes:
+    """ Generates a typical EEPROM image of blank space with tables and strings scattered through it """
+    rng = random.Random(seed)
+    data = bytearray([0xff] * size)
+    position = 0
+    while position < size:
+        length = rng.randint(8, 96)
+        if rng.random() < 0.5:
+            data[position:position + length] = bytes(rng.randrange(256) for _ in range(length))[:size - position]
+        elif rng.random() < 0.5:
+            data[position:position + length] = bytes([rng.randrange(256)] * length)[:size - position]
+        position += length + rng.randint(0, 64)
+    return bytes(data)
+
+
+# Benchmarks. Each takes a working folder, sets everything up and returns a function that does the
+# work being measured (with a close attribute if anything needs cleaning up afterwards), or a list
+# of arguments for a command to run as a separate process.
+def bench_picaxe_combine(directory: str):
+    """ picaxe.py merging a 40 file, 4000+ line include tree and saving the dependencies and graph """
+    main = make_program(directory, files=40, subroutines=12)
+    return [sys.executable, tool("PythonPreprocessor", "picaxe.py"), "-s",
+            "--compiler=" + tool("PythonPreprocessor", "Testing", "stub_compiler.py"),
+            "--output=" + os.path.join(directory, "combined.bas"), "--deps", "--graph", main]
+
+
+def bench_picaxe_size_report(directory: str):
+    """ picaxe.py --size-report on a 6 file program (compiles each subroutine on its own) """
+    main = make_program(directory, files=6, subroutines=6)
+    return [sys.executable, tool("PythonPreprocessor", "picaxe.py"),
+            "--compiler=" + tool("PythonPreprocessor", "Testing", "stub_compiler.py"),
+            "--output=" + os.path.join(directory, "combined.bas"),
+            "--size-report=" + os.path.join(directory, "report.json"), main]
+
+
+def bench_variable_count(directory: str):
+    """ variable_count.py on a 1500 line flattened program """
+    flatten(make_program(directory, files=15, subroutines=10), os.path.join(directory, "compiled_slot1.bas"))
+    return [sys.executable, tool("VariableAnalyser", "variable_count.py")]
+
+
+def bench_contracts(directory: str):
+    """ contracts.py checking every contract in a 40 file, 480 subroutine program """
+    contracts = use_tool("VariableAnalyser", "contracts")
+    main = make_program(directory, files=40, subroutines=12)
+
+    def run():
+        program = contracts.Program()
+        program.parse(main)
+        program.analyse()
+        for subroutine in program.order:
+            program.check(subroutine)
+    return run
+
+
+def bench_symbol_index_build(directory: str):
+    """ symbol_index.py indexing a 40 file program from scratch and looking up every label """
+    symbol_index = use_tool("VariableAnalyser", "symbol_index")
+    make_program(directory, files=40, subroutines=12)
+    cache = os.path.join(directory, "index.json")
+
+    def run():
+        if os.path.exists(cache):
+            os.remove(cache)
+        index = symbol_index.SymbolIndex(directory, cache)
+        index.update()
+        for name in index.lookup():
+            index.callers(name)
+    return run
+
+
+def bench_symbol_index_update(directory: str):
+    """ symbol_index.py checking a 40 file program for changes when nothing has changed """
+    symbol_index = use_tool("VariableAnalyser", "symbol_index")
+    make_program(directory, files=40, subroutines=12)
+    cache = os.path.join(directory, "index.json")
+    symbol_index.SymbolIndex(directory, cache).update()
+
+    def run():
+        symbol_index.SymbolIndex(directory, cache).update()
+    return run
+
+
+def compression(size: int):
+    def setup(directory: str):
+        eeprom_tools = use_tool("EEPROMTools", "EEPROMTools")
+        data = make_eeprom_image(size)
+
+        def run():
+            blocks = eeprom_tools.compress(data)
+            if eeprom_tools.decompress(blocks) != data:
+                raise AssertionError("Decompressed data does not match")
+        return run
+    setup.__doc__ = """ EEPROMTools.py compressing and decompressing a {} KB image """.format(size // 1024)
+    return setup
+
+
+def transfer(size: int, compressed: bool):
+    def setup(directory: str):
+        eeprom_tools = use_tool("EEPROMTools", "EEPROMTools")
+        try:
+            import serial
+            from picaxe_standin import StandIn
+        except ImportError as error:
+            raise Skip("needs {}".format(error.name))
+        data = make_eeprom_image(size)
+        eeprom_tools.small_sleep_time = 0 # The stand in can keep up
+        eeprom_tools.sleep_time = 0
+        write = eeprom_tools.write_memory_compressed if compressed else eeprom_tools.write_memory
+
+        # One stand in is used for every run so that only the transfers are timed
+        stand_in = StandIn(bytes(size)).__enter__()
+        ser = serial.Serial(stand_in.port, eeprom_tools.baud, timeout=5)
+        ser.read_until(eeprom_tools.acknowledge) # Sent when it starts, like entering computer mode
+
+        def run():
+            eeprom_tools.ser = ser # Each transfer benchmark has its own stand in
+            stand_in.memory[:] = bytes(size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                write(0, size - 1, data)
+                handled = eeprom_tools.query_mode() # Waits for the last byte to be handled
+            if not handled:
+                raise AssertionError("No response from the stand in after writing")
+            if bytes(stand_in.memory) != data:
+                raise AssertionError("The stand in's memory does not match")
+
+        def close():
+            ser.close()
+            stand_in.__exit__(None, None, None)
+        run.close = close
+        return run
+    setup.__doc__ = """ EEPROMTools.py writing a {} KB image {}to a stand in PICAXE over a pseudo terminal """.format(
+        size // 1024, "compressed " if compressed else "")
+    return setup
+
+
+def bench_calibration_sweep(directory: str):
+    """ voltagecallibration.py finding the best fraction for 100 voltage dividers """
+    calibration = use_tool("ADC Calibration Factor calculator", "voltagecallibration")
+
+    def run():
+        for r2 in range(4000, 9000, 50):
+            calibration.best_fraction(calibration.battery_factor(r2=r2))
+    return run
+
+
+def bench_lora_settings_sweep(directory: str):
+    """ calculations.py working out the register table and airtime for every LoRa setting """
+    calculations = use_tool(os.path.join("LoRa and PJON", "include"), "calculations")
+
+    def run():
+        for freq in range(433000000, 435000000, 25000):
+            for spread_factor in range(7, 13):
+                for power in range(2, 21):
+                    calculations.burst_table(calculations.init_registers(freq, spread_factor, 125000, power))
+                calculations.airtime(255, spread_factor, 125000)
+    return run
+
+
+def bench_tune_packer(directory: str):
+    """ tune_packer.py packing 12 tunes of 150 notes made from a small set of phrases """
+    tune_packer = use_tool("MusescoreTuneConverter", "tune_packer")
+    rng = random.Random(1)
+    motifs = [[rng.randrange(256) for _ in range(rng.randint(4, 12))] for _ in range(30)]
+    data = []
+    for _ in range(12):
+        notes = []
+        while len(notes) < 150:
+            notes += rng.choice(motifs) if rng.random() < 0.8 else [rng.randrange(256)]
+        data.append(notes)
+
+    def run():
+        tunes = [tune_packer.Tune("tune{}".format(i), 5, notes) for i, notes in enumerate(data)]
+        shared = tune_packer.pack(tunes)
+        tune_packer.number_phrases(tunes, shared)
+    return run
+
+
+def bench_serial_capture_decode(directory: str):
+    """ serial_capture.py splitting 2 MB of text and debug frames into records """
+    serial_capture = use_tool("SerialCapture", "serial_capture")
+    rng = random.Random(1)
+    stream = bytearray()
+    while len(stream) < 2000000:
+        if rng.random() < 0.3:
+            stream += serial_capture.make_frame(rng.randrange(8), bytes(rng.randrange(256) for _ in range(rng.randint(1, 16))))
+        else:
+            stream += "Reading {} = {}\r\n".format(rng.randrange(100), rng.randrange(65536)).encode()
+    chunks = [bytes(stream[i:i + 4096]) for i in range(0, len(stream), 4096)]
+
+    def run():
+        decoder = serial_capture.StreamDecoder(frames=True)
+        for chunk in chunks:
+            decoder.feed(chunk, 0.0)
+        decoder.flush()
+    return run
+
+
+def bench_profile_collector(directory: str):
+    """ profile_collector.py matching 500000 markers from 20 nested subroutines """
+    profile_collector = use_tool("PythonPreprocessor", "profile_collector")
+    markers = {"subroutines": [{"name": "sub{}".format(i), "entry": 0x80 + i * 2, "exit": 0x81 + i * 2} for i in range(20)]}
+    rng = random.Random(1)
+    stream = bytearray()
+    stack = []
+    while len(stream) < 500000:
+        if stack and (len(stack) > 6 or rng.random() < 0.5):
+            stream.append(stack.pop() + 1)
+        else:
+            entry = 0x80 + rng.randrange(20) * 2
+            stack.append(entry)
+            stream.append(entry)
+    chunks = [bytes(stream[i:i + 4096]) for i in range(0, len(stream), 4096)]
+
+    def run():
+        collector = profile_collector.Collector(markers)
+        for number, chunk in enumerate(chunks):
+            collector.feed(chunk, number * 0.01)
+        collector.report()
+    return run
+
+
+BENCHMARKS = {
+    "picaxe_combine": bench_picaxe_combine,
+    "picaxe_size_report": bench_picaxe_size_report,
+    "variable_count": bench_variable_count,
+    "contracts": bench_contracts,
+    "symbol_index_build": bench_symbol_index_build,
+    "symbol_index_update": bench_symbol_index_update,
+    "eeprom_compress_2k": compression(2048),
+    "eeprom_compress_32k": compression(32768),
+    "eeprom_write_2k": transfer(2048, False),
+    "eeprom_write_32k": transfer(32768, False),
+    "eeprom_write_compressed_2k": transfer(2048, True),
+    "eeprom_write_compressed_32k": transfer(32768, True),
+    "calibration_sweep": bench_calibration_sweep,
+    "lora_settings_sweep": bench_lora_settings_sweep,
+    "tune_packer": bench_tune_packer,
+    "serial_capture_decode": bench_serial_capture_decode,
+    "profile_collector": bench_profile_collector,
+}
+
+
+# Measuring
+def run_process(command: list, directory: str) -> tuple:
+    """ Runs a command and returns the time it took and its peak memory in KB (None if unknown) """
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read()
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        peak = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    else:
+        process.wait()
+        peak = None
+    elapsed = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError("'{}' failed:\n{}".format(" ".join(command), output.decode(errors="replace")[-2000:]))
+    return elapsed, peak
+
+
+def warm_up(benchmark: dict) -> None:
+    """ Runs a benchmark once before it is timed. Commands have their peak memory recorded now, as a
+    child process's peak includes however much memory this process had used when it was started, so
+    they are at the start of BENCHMARKS. Benchmarks quicker than SAMPLE_SECONDS are run several
+    times for each time recorded. """
+    work = benchmark["work"]
+    if isinstance(work, list):
+        benchmark["peak"] = run_process(work, benchmark["directory"])[1]
+    else:
+        started = time.perf_counter()
+        work() # Imports, caches...
+        benchmark["number"] = max(1, int(SAMPLE_SECONDS / max(time.perf_counter() - started, 1e-6)))
+
+
+def measure(names: list, repeat: int) -> tuple:
+    """ Runs the benchmarks and returns their results and the reasons any were skipped.
+    The benchmarks take turns, one run each per round, so that the times for each one are spread
+    over the whole run instead of all landing in a patch where the computer was busy. """
+    results = {}
+    skipped = {}
+    with contextlib.ExitStack() as stack:
+        benchmarks = {}
+        for name in names:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            try:
+                work = BENCHMARKS[name](directory)
+            except Skip as reason:
+                skipped[name] = reason
+                continue
+            if hasattr(work, "close"):
+                stack.callback(work.close)
+            benchmarks[name] = {"work": work, "directory": directory, "number": 1, "times": []}
+            if isinstance(work, list):
+                warm_up(benchmarks[name]) # Before the other benchmarks are set up and use more memory
+        for benchmark in benchmarks.values():
+            if not isinstance(benchmark["work"], list):
+                warm_up(benchmark)
+
+        for _ in range(repeat):
+            for benchmark in benchmarks.values():
+                work = benchmark["work"]
+                if isinstance(work, list):
+                    elapsed = run_process(work, benchmark["directory"])[0]
+                else:
+                    started = time.perf_counter()
+                    for _ in range(benchmark["number"]):
+                        work()
+                    elapsed = (time.perf_counter() - started) / benchmark["number"]
+                benchmark["times"].append(elapsed)
+
+        for name, benchmark in benchmarks.items():
+            if isinstance(benchmark["work"], list):
+                peak = benchmark["peak"]
+                memory = "maxrss"
+            else:
+                tracemalloc.start()
+                try:
+                    benchmark["work"]()
+                    peak = tracemalloc.get_traced_memory()[1] // 1024
+                finally:
+                    tracemalloc.stop()
+                memory = "tracemalloc"
+            times = benchmark["times"]
+            results[name] = {"seconds": min(times), "median_seconds": statistics.median(times), "peak_kb": peak,
+                             "memory": memory}
+    return results, skipped
+
+
+def compare(result: dict, baseline: dict, threshold: float, memory_threshold: float, min_seconds: float) -> list:
+    """ Returns a list of the ways the result is worse than the baseline """
+    problems = []
+    expected = baseline["median_seconds"]
+    slower = result["median_seconds"] - expected
+    if slower > min_seconds and result["median_seconds"] > expected * (1 + threshold / 100):
+        problems.append("{:.0f}% slower".format(slower / expected * 100))
+    if result["peak_kb"] is not None and baseline.get("peak_kb") and result.get("memory") == baseline.get("memory"):
+        if result["peak_kb"] > baseline["peak_kb"] * (1 + memory_threshold / 100):
+            problems.append("{:.0f}% more memory".format((result["peak_kb"] / baseline["peak_kb"] - 1) * 100))
+    return problems
+
+
+def change(current, previous) -> str:
+    """ Formats the change from the baseline as a percentage """
+    if current is None or not previous:
+        return ""
+    return "{:+.0f}%".format((current / previous - 1) * 100)
+
+
+def load_baseline(filename: str) -> dict:
+    try:
+        with open(filename) as file:
+            baseline = json.load(file)
+    except OSError:
+        return {}
+    if baseline.get("version") != BASELINE_VERSION:
+        print("Ignoring '{}' as it was saved by a different version of this script".format(filename))
+        return {}
+    return baseline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the Python tools and compares the results with a saved baseline.")
+    parser.add_argument("--only", action="append", help="Only run benchmarks with this in their name. Can be given more than once")
+    parser.add_argument("--repeat", type=int, default=7, help="Times to run each benchmark. The median time is compared (default 7)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file (default baseline.json next to this script)")
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline (only the benchmarks that were run are replaced)")
+    parser.add_argument("--threshold", type=float, default=25, help="Percent slower than the baseline that counts as a regression (default 25)")
+    parser.add_argument("--memory-threshold", type=float, default=10, help="Percent more peak memory that counts as a regression (default 10)")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Ignore time differences smaller than this (default 0.005)")
+    parser.add_argument("--json", help="Also save the results of this run to this file")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, setup in BENCHMARKS.items():
+            print("{:<28} {}".format(name, (setup.__doc__ or "").strip()))
+        sys.exit(0)
+
+    names = [name for name in BENCHMARKS if not args.only or any(part in name for part in args.only)]
+    if not names:
+        print("No benchmarks match {}".format(", ".join(args.only)))
+        sys.exit(1)
+    baseline = load_baseline(args.baseline)
+    previous = baseline.get("results", {})
+
+    results, skipped = measure(names, args.repeat)
+    print("{:<28} {:>10} {:>8} {:>10} {:>8}  {}".format("Benchmark", "Median s", "Change", "Peak KB", "Change", "Result"))
+    regressions = 0
+    for name in names:
+        if name in skipped:
+            print("{:<28} skipped ({})".format(name, skipped[name]))
+            continue
+        result = results[name]
+        old = previous.get(name)
+        problems = compare(result, old, args.threshold, args.memory_threshold, args.min_seconds) if old else []
+        regressions += bool(problems)
+        status = ", ".join(problems) if problems else ("ok" if old else "no baseline")
+        print("{:<28} {:>10.4f} {:>8} {:>10} {:>8}  {}".format(
+            name, result["median_seconds"], change(result["median_seconds"], old and old["median_seconds"]),
+            "?" if result["peak_kb"] is None else result["peak_kb"],
+            change(result["peak_kb"], old and old.get("peak_kb")), status))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.save:
+        previous.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump({
+                "version": BASELINE_VERSION,
+                "saved": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": previous,
+            }, file, indent=4)
+        print("Saved the baseline to '{}'".format(args.baseline))
+    elif regressions:
+        print("{} benchmarks regressed".format(regressions))
+        sys.exit(1)
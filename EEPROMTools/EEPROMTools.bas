@@ -8,7 +8,7 @@
 ;
 ; Jotham Gates
 ; Created 03/04/2021
-; Modified 03/04/2021
+; Modified 19/10/2026
 
 #PICAXE 18M2 ; Just so the command line compiler behaves. This an be changed
 #NO_DATA
@@ -35,6 +35,14 @@ symbol tmpwd4 = w7
 symbol tmpwd4l = b14
 symbol tmpwd4h = b15
 
+; Compressed writes
+symbol block_control = b0
+symbol block_value = b1
+symbol page_first = w1 ; First address to write in the current page
+symbol page_firstl = b2
+symbol page_offset = b4
+symbol PAGE_BUFFER = 28 ; 16 bytes of RAM after the named variables, accessed with bptr
+
 ; The EEPROM chip I am using uses its address to select banks, so this has to be set as well.
 #MACRO EEPROM_SETUP(ADDR, TMPVAR)
 	; ADDR is a word
@@ -86,6 +94,37 @@ computer_mode_loop:
             next tmpwd0
             low PIN_LED_ON
             ; Done
+        case "c" ; Compressed write
+            low PIN_LED_ALARM
+            serrxd tmpwd1l, tmpwd1h, tmpwd2l, tmpwd2h ; Start and end address (inclusive) in little endian
+            high PIN_LED_ALARM
+            high PIN_LED_ON
+            tmpwd0 = tmpwd1 ; Current address
+            do
+                sertxd(1) ; Ready for the next block
+                serrxd block_control, block_value
+                if block_control >= 0x80 then
+                    ; Run of (block_control & 0x7f) + 1 copies of block_value
+                    block_control = block_control & 0x7f
+                    gosub buffer_byte
+                    do while block_control > 0
+                        gosub buffer_byte
+                        dec block_control
+                    loop
+                else
+                    ; block_control + 1 literal bytes, starting with block_value
+                    gosub buffer_byte
+                    do while block_control > 0
+                        sertxd(1) ; Acknowledge
+                        serrxd block_value
+                        gosub buffer_byte
+                        dec block_control
+                    loop
+                endif
+                toggle PIN_LED_ON
+            loop while tmpwd0 <= tmpwd2
+            sertxd(1) ; Finished
+            low PIN_LED_ON
         case "q" ; Reset
             reset
         case "p" ; Programming mode
@@ -94,4 +133,37 @@ computer_mode_loop:
         case "?" ; Query if this program is running correctly
             sertxd(1)
     end select
-    goto computer_mode_loop
\ No newline at end of file
+    goto computer_mode_loop
+
+buffer_byte:
+    ; Puts block_value into the page buffer at the current address (tmpwd0) and writes the page
+    ; once it is full or the end address (tmpwd2) has been reached. Increments tmpwd0.
+    bptr = tmpwd0 & 0x0f + PAGE_BUFFER
+    @bptr = block_value
+    page_offset = tmpwd0 & 0x0f
+    if page_offset = 0x0f or tmpwd0 = tmpwd2 then
+        gosub write_page
+    endif
+    inc tmpwd0
+    return
+
+write_page:
+    ; Writes the buffered bytes of the current page up to the current address (tmpwd0) into the
+    ; EEPROM. Whole aligned pages are written at once, otherwise each byte is written separately.
+    page_first = tmpwd0 & 0xfff0
+    if page_first < tmpwd1 then
+        page_first = tmpwd1 ; Started part way through this page
+    endif
+    bptr = page_first & 0x0f + PAGE_BUFFER
+    if bptr = PAGE_BUFFER and page_offset = 0x0f then
+        EEPROM_SETUP(page_first, tmpwd3l)
+        hi2cout page_firstl, (@bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc, @bptrinc)
+        pause 80
+    else
+        for page_first = page_first to tmpwd0
+            EEPROM_SETUP(page_first, tmpwd3l)
+            hi2cout page_firstl, (@bptrinc)
+            pause 80
+        next page_first
+    endif
+    return
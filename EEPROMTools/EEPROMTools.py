@@ -4,21 +4,36 @@ Tools for backing up and restoring data to eeprom chips connected to a PICAXE
 microcontroller.
 Written by Jotham Gates
 Created 03/04/2021
-Modified 03/04/2021
+Modified 19/10/2026
 """
 import serial
 import sys
 import time
 
-ser = serial.Serial("/dev/ttyUSB0", 38400)
+port = "/dev/ttyUSB0"
+baud = 38400
+ser = None # Opened in main so that the functions can be used without a PICAXE connected
 sleep_time = 0.2 # Time so the interpretor in the PICAXE can keep up.
 small_sleep_time = 0.01
 acknowledge = b'\x01' # Char to receive
+
+# Compressed writes
+max_block = 128 # Longest run or literal block
+min_run = 3 # Shortest run worth sending as a run instead of including in a literal block
+page_size = 16 # Bytes in an EEPROM page write
+
+# Rough times used to estimate how long writing will take
+byte_time = 10 / baud # Start, 8 data and stop bits
+turnaround_time = 0.002 # Computer seeing an acknowledgement and replying
+write_cycle_time = 0.01 # pause 80 at 32MHz after each write
+decode_time = 0.001 # PICAXE time to buffer each byte when decompressing
+
 def print_help():
     print("""EEPROMTools.py MODE [[[START]] [END]] [FILENAME]
 
 Where:
-    MODE is read or write (r/w or read/write)
+    MODE is read, write, compressed write or test (r/w/c/t or
+        read/write/compressed/test)
     START is the start address (optional, default 0)
     END is the inclusive end address (optional, default 2048)
     FILENAME is the file to read or write (optional, default EEPROM.bas)
@@ -37,6 +52,21 @@ Serial Protocol:
         format and the end address as 2 bytes.
         Then for each byte to write, send the byte and wait for a 1 to be sent
         back as acknowledgement before sending the next.
+
+    Compressed write:
+        'c' is sent, followed by the start and end addresses as for write.
+        The data is sent as blocks. Before each block, wait for a 1. Each block
+        starts with a control byte:
+            - If the top bit is set, the block is a run of (control & 0x7f) + 1
+              copies of the next byte.
+            - Otherwise, the block is control + 1 literal bytes. Wait for a 1
+              before each literal byte after the first.
+        A 1 is sent once everything has been written. Whole aligned pages are
+        written using page writes.
+
+    Test:
+        Writes FILENAME normally and compressed to a software stand in for the
+        PICAXE, checks the result and compares how long each would take.
 """)
 
 def enter_computer_mode():
@@ -87,6 +117,148 @@ def write_memory(start: int, end:int, data: bytearray) -> None:
     print("\nFinished writing")
 
 
+def compress(data: bytes) -> list:
+    """ Splits the data into runs and literal blocks for compressed writes.
+    Returns a list of (control byte, bytes to send after it) tuples. """
+    blocks = []
+    literal = bytearray()
+    i = 0
+    while i < len(data):
+        run = 1
+        while i + run < len(data) and run < max_block and data[i + run] == data[i]:
+            run += 1
+
+        if run >= min_run:
+            if literal:
+                blocks.append((len(literal) - 1, bytes(literal)))
+                literal.clear()
+            blocks.append((0x80 | (run - 1), bytes([data[i]])))
+            i += run
+        else:
+            literal.append(data[i])
+            if len(literal) == max_block:
+                blocks.append((len(literal) - 1, bytes(literal)))
+                literal.clear()
+            i += 1
+
+    if literal:
+        blocks.append((len(literal) - 1, bytes(literal)))
+    return blocks
+
+def decompress(blocks: list) -> bytes:
+    """ Expands blocks from compress() back into the original data """
+    data = bytearray()
+    for control, payload in blocks:
+        if control & 0x80:
+            data += payload * ((control & 0x7f) + 1)
+        else:
+            data += payload
+    return bytes(data)
+
+def compressed_length(blocks: list) -> int:
+    """ Number of bytes sent to the PICAXE for the blocks, not including acknowledgements """
+    return sum(1 + len(payload) for _, payload in blocks)
+
+def count_writes(start: int, end: int) -> tuple:
+    """ Returns the number of page writes and single byte writes needed for a compressed write """
+    pages = 0
+    singles = 0
+    page_start = start
+    while page_start <= end:
+        page_end = min(page_start - page_start % page_size + page_size - 1, end)
+        if page_start % page_size == 0 and page_end - page_start + 1 == page_size:
+            pages += 1
+        else:
+            singles += page_end - page_start + 1
+        page_start = page_end + 1
+    return pages, singles
+
+def estimate_write_time(start: int, end: int) -> float:
+    """ Rough number of seconds write_memory() takes """
+    length = end - start + 1
+    return length * (2 * byte_time + turnaround_time + small_sleep_time + write_cycle_time)
+
+def estimate_compressed_time(start: int, end: int, blocks: list) -> float:
+    """ Rough number of seconds write_memory_compressed() takes """
+    extra_literals = sum(len(payload) - 1 for control, payload in blocks if not control & 0x80)
+    pages, singles = count_writes(start, end)
+    return (len(blocks) * (3 * byte_time + turnaround_time)
+            + extra_literals * (2 * byte_time + turnaround_time)
+            + (end - start + 1) * decode_time
+            + (pages + singles) * write_cycle_time)
+
+def write_memory_compressed(start: int, end: int, data: bytearray) -> None:
+    """ Sends data to write to the microcontroller using runs and literal blocks """
+    length = end-start+1
+    if len(data) < length:
+        raise ValueError("Only {} bytes given to write from {} to {}".format(len(data), start, end))
+    blocks = compress(data[:length])
+    print("Sending compressed write command")
+    ser.write(b'c')
+    time.sleep(sleep_time)
+    ser.write(start.to_bytes(2,'little'))
+    time.sleep(sleep_time)
+    ser.write(end.to_bytes(2,'little'))
+    print("Sent params")
+    for control, payload in blocks:
+        ser.read() # Ready for the next block
+        ser.write(bytes([control, payload[0]]))
+        if not control & 0x80:
+            for value in payload[1:]:
+                ser.read()
+                ser.write(bytes([value]))
+        print(".", end="", flush=True)
+
+    ser.read() # Finished writing
+    print("\nFinished writing")
+
+def print_compression(start: int, end: int, blocks: list) -> None:
+    """ Prints how much smaller and faster a compressed write should be """
+    length = end - start + 1
+    sent = compressed_length(blocks)
+    normal = estimate_write_time(start, end)
+    compressed = estimate_compressed_time(start, end, blocks)
+    print("Compressed {} bytes into {} blocks of {} bytes (ratio {:.2f}:1)".format(length, len(blocks), sent, length / sent))
+    print("Estimated time: {:.1f}s normally, {:.1f}s compressed (saves {:.1f}s)".format(normal, compressed, normal - compressed))
+
+def self_test(filename: str, start: int, end: int) -> bool:
+    """ Writes the file to a software stand in for the PICAXE both normally and compressed and
+    checks both worked. Returns True if they did. """
+    global ser, small_sleep_time, sleep_time
+    from picaxe_standin import StandIn # Only needed for testing
+
+    data = read_file(filename)
+    end = min(end, start + len(data) - 1)
+    expected = bytes(data[:end - start + 1])
+    small_sleep_time = 0 # The stand in can keep up
+    sleep_time = 0
+    passed = True
+    results = {}
+    for name, write in (("Normal", write_memory), ("Compressed", write_memory_compressed)):
+        with StandIn() as stand_in:
+            ser = serial.Serial(stand_in.port, baud, timeout=5)
+            if not query_mode():
+                enter_computer_mode()
+            started = time.time()
+            write(start, end, data)
+            # The last byte of a normal write is not acknowledged, so make sure it has been handled
+            # before the memory is checked. Commands are handled in order.
+            if not query_mode():
+                print("{} write: no response from the stand in after writing".format(name))
+                passed = False
+            results[name] = time.time() - started
+            ser.close()
+            written = bytes(stand_in.memory[start:end + 1])
+            print("{} write: {} bytes received, {} page writes, {} byte writes, took {:.2f}s".format(
+                name, stand_in.received, stand_in.page_writes, stand_in.byte_writes, results[name]))
+            if written != expected:
+                print("{} write FAILED. The stand in's memory does not match '{}'".format(name, filename))
+                passed = False
+
+    print_compression(start, end, compress(expected))
+    print("Self test {}".format("passed" if passed else "FAILED"))
+    return passed
+
 def write_file(filename: str, data: bytearray) -> None:
     """ Writes a binary file than can then be edited with a hex editor """
     with open(filename, "wb") as file:
@@ -125,6 +297,9 @@ if __name__ == "__main__":
     end_addr = 2047
     filename = "EEPROM.bin"
 
+    compressed = False
+    test = False
+
     if len(sys.argv) == 1:
         # No args given
         print_help()
@@ -138,6 +313,11 @@ if __name__ == "__main__":
             read = True
         elif mode == "w" or mode == "write":
             read = False
+        elif mode == "c" or mode == "compressed":
+            read = False
+            compressed = True
+        elif mode == "t" or mode == "test":
+            test = True
         else:
             print_help()
             do_operations = False
@@ -155,7 +335,13 @@ if __name__ == "__main__":
                     # Start arg
                     start_addr = int(sys.argv[-3])
 
+    if do_operations and test:
+        do_operations = False
+        if not self_test(filename, start_addr, end_addr):
+            sys.exit(1)
+
     if do_operations:
+        ser = serial.Serial(port, baud)
         if not query_mode():
             print("Microcontroller is not in the correct mode.\nAttempting to enter it now.")
             enter_computer_mode()
@@ -180,6 +366,10 @@ if __name__ == "__main__":
             # Open and write the new file
             print("Writing file to eeprom")
             data = read_file(filename)
-            write_memory(start_addr, end_addr, data)
+            if compressed:
+                print_compression(start_addr, end_addr, compress(data[:end_addr - start_addr + 1]))
+                write_memory_compressed(start_addr, end_addr, data)
+            else:
+                write_memory(start_addr, end_addr, data)
 
         print("Done")
\ No newline at end of file
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+A software stand in for a PICAXE running EEPROMTools.bas with an EEPROM connected, for testing
+EEPROMTools.py without any hardware. The stand in runs in a thread on the other end of a pseudo
+terminal and follows the same serial protocol, including buffering compressed writes into pages
+the same way as EEPROMTools.bas, so that its page and byte write counts can be checked.
+Only works on platforms with pseudo terminals (Linux, macOS...).
+
+Usage:
+    with StandIn() as stand_in:
+        ser = serial.Serial(stand_in.port, 38400)
+        ...
+        stand_in.memory # Contents of the EEPROM
+
+Created 19/10/2026
+Modified 19/10/2026
+"""
+import os
+import pty
+import threading
+import tty
+
+EEPROM_SIZE = 2048
+PAGE_SIZE = 16
+ACKNOWLEDGE = 1
+
+class StandInError(Exception):
+    """ Raised in the stand in's thread when something is sent that a real PICAXE would not handle """
+
+class StandIn:
+    """ Pretends to be a PICAXE running EEPROMTools.bas """
+    def __init__(self, memory: bytes = None):
+        self.memory = bytearray(memory) if memory is not None else bytearray([0xff] * EEPROM_SIZE)
+        self.received = 0 # Bytes received from the computer
+        self.page_writes = 0
+        self.byte_writes = 0
+        self.error = None
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        os.close(self._master) # Makes the thread stop reading
+        self._thread.join(1)
+        os.close(self._slave)
+        if self.error is not None and args[0] is None:
+            raise self.error
+
+    def _read(self, count: int = 1) -> bytes:
+        """ Waits for bytes from the computer (serrxd) """
+        data = bytearray()
+        while len(data) < count:
+            chunk = os.read(self._master, count - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        self.received += count
+        return bytes(data)
+
+    def _write(self, data: bytes) -> None:
+        """ Sends bytes to the computer (sertxd) """
+        os.write(self._master, data)
+
+    def _read_address(self) -> int:
+        return int.from_bytes(self._read(2), "little")
+
+    def _run(self) -> None:
+        """ The computer_mode_loop of EEPROMTools.bas """
+        try:
+            self._write(bytes([ACKNOWLEDGE]))
+            while True:
+                command = self._read()
+                if command == b"r":
+                    start = self._read_address()
+                    end = self._read_address()
+                    self._write(bytes(self.memory[start:end + 1]))
+                elif command == b"w":
+                    start = self._read_address()
+                    end = self._read_address()
+                    for address in range(start, end + 1):
+                        self._write(bytes([ACKNOWLEDGE]))
+                        self.memory[address] = self._read()[0]
+                        self.byte_writes += 1
+                elif command == b"c":
+                    self._compressed_write()
+                elif command == b"?":
+                    self._write(bytes([ACKNOWLEDGE]))
+        except (EOFError, OSError):
+            pass # Closed
+        except StandInError as error:
+            self.error = error
+
+    def _compressed_write(self) -> None:
+        """ The "c" case in EEPROMTools.bas """
+        start = self._read_address()
+        end = self._read_address()
+        page = bytearray(PAGE_SIZE)
+        address = start
+        while address <= end:
+            self._write(bytes([ACKNOWLEDGE]))
+            control, value = self._read(2)
+            if control & 0x80:
+                values = [value] * ((control & 0x7f) + 1)
+            else:
+                values = [value]
+                for _ in range(control):
+                    self._write(bytes([ACKNOWLEDGE]))
+                    values.append(self._read()[0])
+
+            for value in values:
+                if address > end:
+                    raise StandInError("Block goes past the end address {}".format(end))
+                page[address % PAGE_SIZE] = value
+                if address % PAGE_SIZE == PAGE_SIZE - 1 or address == end:
+                    self._write_page(page, max(address - address % PAGE_SIZE, start), address)
+                address += 1
+        self._write(bytes([ACKNOWLEDGE]))
+
+    def _write_page(self, page: bytearray, first: int, last: int) -> None:
+        """ write_page in EEPROMTools.bas """
+        if first % PAGE_SIZE == 0 and last - first == PAGE_SIZE - 1:
+            self.page_writes += 1
+        else:
+            self.byte_writes += last - first + 1
+        for address in range(first, last + 1):
+            self.memory[address] = page[address % PAGE_SIZE]
@@ -5,10 +5,11 @@ Most of the functions in this file were adapted from parts of the Arduino LoRa
 library from here: https://github.com/sandeepmistry/arduino-LoRa
 This file written by Jotham Gates
 Created: 22/11/2020
-Modified: 25/12/2020
+Modified: 19/10/2026
 https://github.com/jgOhYeah/PICAXE-Libraries-Extras
 """
 from datetime import datetime # To print generated date
+import math
 
 # Default configuration. Set ask_every to False to use this instead of asking
 # every time.
@@ -16,8 +17,30 @@ ask_every = True
 freq = 433000000
 spread_factor = 9 # Spread factor 6 is not supported.
 bandwidth = 125000 # Default 125kHz bandwidth that this library currently cannot change
+tx_power = 17 # dBm, the same as begin_lora uses
+table_start = 0 # Address in table memory for the register initialisation table
 output_file = "generated.basinc"
 
+# Registers and their values after the module is reset, used to precalculate read-modify-writes.
+REG_OP_MODE = 0x01
+REG_FRF_MSB = 0x06
+REG_FRF_MID = 0x07
+REG_FRF_LSB = 0x08
+REG_PA_CONFIG = 0x09
+REG_OCP = 0x0b
+REG_LNA = 0x0c
+REG_FIFO_TX_BASE_ADDR = 0x0e
+REG_FIFO_RX_BASE_ADDR = 0x0f
+REG_MODEM_CONFIG_2 = 0x1e
+REG_MODEM_CONFIG_3 = 0x26
+REG_DETECTION_OPTIMIZE = 0x31
+REG_DETECTION_THRESHOLD = 0x37
+REG_PA_DAC = 0x4d
+RESET_LNA = 0x20
+RESET_MODEM_CONFIG_2 = 0x70
+MODE_SLEEP = 0x80 # Including MODE_LONG_RANGE_MODE
+MODE_STDBY = 0x81
+
 
 def ask_user():
     """ Asks the user to manually type in values """
@@ -64,6 +87,73 @@ def ldo(bandwidth, spread_factor):
     symbol_duration = 1000 / (bandwidth / (1 << spread_factor))
     return bool(symbol_duration > 16)
 
+def ocp(milliamps):
+    """ Calculates the overcurrent protection register value the same as set_OCP """
+    trim = 27
+    if milliamps <= 120:
+        trim = (milliamps - 45) // 5
+    elif milliamps <= 240:
+        trim = (milliamps + 30) // 10
+    return 0x20 | (0x1f & trim)
+
+def power_registers(power):
+    """ Calculates the PA_DAC, OCP and PA_CONFIG values the same as set_tx_power """
+    if power > 17:
+        power = min(power, 20) - 3
+        return {REG_PA_DAC: 0x87, REG_OCP: ocp(140), REG_PA_CONFIG: 0x80 | (power - 2)}
+    power = max(power, 2)
+    return {REG_PA_DAC: 0x84, REG_OCP: ocp(100), REG_PA_CONFIG: 0x80 | (power - 2)}
+
+def init_registers(freq, spread_factor, bandwidth, power):
+    """ Calculates every register that begin_lora and set_spreading_factor write, assuming the
+    module has just been reset so that the read-modify-writes can be done in advance.
+    Returns a list of (register, value) tuples in the order they should be written. """
+    lowest, middle, highest = frequency(freq)
+    config = {
+        REG_FRF_MSB: highest,
+        REG_FRF_MID: middle,
+        REG_FRF_LSB: lowest,
+        REG_FIFO_TX_BASE_ADDR: 0,
+        REG_FIFO_RX_BASE_ADDR: 0,
+        REG_LNA: RESET_LNA | 0x03, # LNA boost
+        REG_MODEM_CONFIG_3: 0x04 | (int(ldo(bandwidth, spread_factor)) << 3), # Auto AGC and LDO flag
+        REG_DETECTION_OPTIMIZE: 0xc3,
+        REG_DETECTION_THRESHOLD: 0x0a,
+        REG_MODEM_CONFIG_2: (RESET_MODEM_CONFIG_2 & 0x0f) | ((spread_factor << 4) & 0xf0),
+    }
+    config.update(power_registers(power))
+
+    # LoRa mode can only be selected while asleep, so sleep first and go to standby at the end.
+    return [(REG_OP_MODE, MODE_SLEEP)] + sorted(config.items()) + [(REG_OP_MODE, MODE_STDBY)]
+
+def burst_table(registers):
+    """ Groups registers with consecutive addresses so they can be written in a single SPI burst.
+    Returns a list of bytes made of records of the first register, the number of registers and
+    their values. """
+    records = []
+    for register, value in registers:
+        if records and records[-1][0] + len(records[-1][1]) == register:
+            records[-1][1].append(value)
+        else:
+            records.append((register, [value]))
+
+    table = []
+    for register, values in records:
+        table.extend([register, len(values)] + values)
+    return table
+
+def airtime(payload_length, spread_factor, bandwidth, coding_rate=5, preamble_length=8, crc=False,
+            implicit_header=False):
+    """ Calculates the time on air in seconds of a LoRa packet. This uses the formula from section
+    4.1.1.7 of the SX1276/77/78/79 datasheet. The defaults match how LoRa.basinc sets up the module
+    (coding rate 4/5, 8 symbol preamble, explicit header and no payload CRC). coding_rate is the
+    denominator of 4/x. """
+    symbol_time = (1 << spread_factor) / bandwidth
+    low_data_rate = int(ldo(bandwidth, spread_factor))
+    numerator = 8 * payload_length - 4 * spread_factor + 28 + 16 * int(crc) - 20 * int(implicit_header)
+    payload_symbols = 8 + max(math.ceil(numerator / (4 * (spread_factor - 2 * low_data_rate))) * coding_rate, 0)
+    return (preamble_length + 4.25 + payload_symbols) * symbol_time
+
 if __name__ == "__main__":
     if ask_every:
         ask_user()
@@ -79,6 +169,19 @@ if __name__ == "__main__":
     data += "#DEFINE LORA_FREQ_LSB 0x{:02X}\n".format(lowest)
     data += "#DEFINE LORA_SPREADING_FACTOR {}\n".format(spread_factor)
     data += "#DEFINE LORA_LDO_ON {}\n\n".format(ldo_flag)
+
+    table = burst_table(init_registers(freq, spread_factor, bandwidth, tx_power))
+    if table_start + len(table) > 255:
+        raise ValueError("The register table does not fit below address 256. Move table_start.")
+    data += "; Registers written by begin_lora when ENABLE_LORA_INIT_TABLE is defined above this file.\n"
+    data += "; Each record is the first register, the number of registers and their values.\n"
+    data += "; Includes set_spreading_factor and a TX power of {}dBm.\n".format(tx_power)
+    data += "#DEFINE LORA_INIT_TABLE_START {}\n".format(table_start)
+    data += "#DEFINE LORA_INIT_TABLE_END {}\n".format(table_start + len(table))
+    data += "#IFDEF ENABLE_LORA_INIT_TABLE\n"
+    data += "table {}, ({})\n".format(table_start, ", ".join("0x{:02X}".format(i) for i in table))
+    data += "#DEFINE LORA_INIT_TABLE_INCLUDED\n"
+    data += "#ENDIF\n\n"
     data += "#DEFINE FILE_GENERATED_INCLUDED ; Prove this file is included properly\n"
     print(data)
     with open(output_file, "w") as output:
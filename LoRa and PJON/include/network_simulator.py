@@ -0,0 +1,313 @@
+#!/bin/env python3
+""" network_simulator.py
+A discrete event simulator to estimate how many PICAXE nodes using PJON over LoRa can share a
+single channel before collisions and acknowledgement retries swamp it.
+Packet lengths follow what PJON.basinc sends (5 byte header, payload and a CRC32) and the time on
+air comes from airtime() in calculations.py.
+Assumptions made:
+ - All nodes and the gateway can hear each other and any overlap of two transmissions destroys both
+   (no capture effect).
+ - Nodes do not listen before talking, the same as end_pjon_packet.
+ - A node can only handle one packet at a time (there is no queue in PJON.basinc), so a packet that
+   is due while the node is still busy with the previous one is dropped.
+ - The gateway replies to each packet it decodes with a 1 byte PJON synchronous acknowledgement.
+   Nodes that do not get an acknowledgement retry with a cubic back off similar to PJON's.
+Created: 19/10/2026
+Modified: 19/10/2026
+https://github.com/jgOhYeah/PICAXE-Libraries-Extras
+"""
+import argparse
+import heapq
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from calculations import airtime, bandwidth as default_bandwidth
+
+PJON_HEADER_LENGTH = 5 # PACKET_HEAD_LENGTH in PJON.basinc (id, header, length, crc8, sender id)
+PJON_CRC_LENGTH = 4 # CRC32 is always used when sending
+PJON_ACK_LENGTH = 1 # Synchronous acknowledgement is a single byte
+
+# Event types
+GENERATE = 0
+TX_START = 1
+TX_END = 2
+ACK_TIMEOUT = 3
+
+
+class Scenario:
+    """ Settings for a single simulation run """
+    def __init__(self, nodes=10, interval=60.0, spread_factor=9, payload_length=10,
+                 bandwidth=default_bandwidth, duration=3600.0, ack=True, max_attempts=5,
+                 back_off=None, turnaround=0.01, jitter=0.1, poisson=False, seed=0):
+        self.nodes = nodes
+        self.interval = interval # Average seconds between packets from each node
+        self.spread_factor = spread_factor
+        self.payload_length = payload_length # Bytes of user data in each PJON packet
+        self.bandwidth = bandwidth
+        self.duration = duration # Simulated seconds
+        self.ack = ack # Wait for acknowledgements and retry if not received
+        self.max_attempts = max_attempts
+        self.back_off = back_off # Seconds, multiplied by attempts cubed. None for 2 packet lengths
+        self.turnaround = turnaround # Seconds between the end of a packet and the ack starting
+        self.jitter = jitter # Fraction of the interval to randomly vary each send by
+        self.poisson = poisson # Exponentially distributed intervals instead of jittered
+        self.seed = seed
+
+    def __repr__(self) -> str:
+        return "Scenario(nodes={}, interval={}, spread_factor={}, payload_length={})".format(
+            self.nodes, self.interval, self.spread_factor, self.payload_length)
+
+
+class Transmission:
+    """ A packet that is currently on air """
+    def __init__(self, node, start, end, is_ack):
+        self.node = node # Node that sent it, or the node it is acknowledging
+        self.start = start
+        self.end = end
+        self.is_ack = is_ack
+        self.collided = False
+
+
+class Node:
+    """ State of a single sensor node """
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.busy = False
+        self.attempts = 0
+        self.acked = False
+        self.received = False # The gateway has decoded at least one copy of the current packet
+
+
+def simulate(scenario: Scenario) -> dict:
+    """ Runs a single scenario and returns a dictionary of results """
+    rng = random.Random(scenario.seed)
+    data_airtime = airtime(PJON_HEADER_LENGTH + scenario.payload_length + PJON_CRC_LENGTH,
+                           scenario.spread_factor, scenario.bandwidth)
+    ack_airtime = airtime(PJON_ACK_LENGTH, scenario.spread_factor, scenario.bandwidth)
+    ack_timeout = scenario.turnaround + ack_airtime + 0.01
+    back_off = scenario.back_off if scenario.back_off is not None else 2 * data_airtime
+
+    nodes = [Node(i) for i in range(scenario.nodes)]
+    events = []
+    sequence = itertools.count() # Tie breaker so events at the same time stay in order
+
+    def schedule(time, event_type, data):
+        heapq.heappush(events, (time, next(sequence), event_type, data))
+
+    def next_interval():
+        if scenario.poisson:
+            return rng.expovariate(1 / scenario.interval)
+        return scenario.interval * (1 + scenario.jitter * rng.uniform(-1, 1))
+
+    # Start every node at a random point in its first interval
+    for node in nodes:
+        schedule(rng.uniform(0, scenario.interval), GENERATE, node)
+
+    on_air = [] # Transmissions currently on air
+    airtime_used = 0 # Total time spent transmitting, counting overlaps once
+    busy_since = None
+    stats = {
+        "generated": 0,
+        "dropped_busy": 0,
+        "delivered": 0,
+        "acknowledged": 0,
+        "failed": 0,
+        "transmissions": 0,
+        "retries": 0,
+        "collisions": 0,
+        "acks_sent": 0,
+        "acks_lost": 0,
+        "attempts_histogram": [0] * (scenario.max_attempts + 1),
+    }
+
+    while events:
+        time, _, event_type, data = heapq.heappop(events)
+        if time > scenario.duration:
+            break
+
+        if event_type == GENERATE:
+            node = data
+            schedule(time + next_interval(), GENERATE, node)
+            stats["generated"] += 1
+            if node.busy:
+                stats["dropped_busy"] += 1
+            else:
+                node.busy = True
+                node.attempts = 0
+                node.acked = False
+                node.received = False
+                schedule(time, TX_START, (node, False))
+
+        elif event_type == TX_START:
+            node, is_ack = data
+            if is_ack:
+                stats["acks_sent"] += 1
+                tx = Transmission(node, time, time + ack_airtime, True)
+            else:
+                node.attempts += 1
+                stats["transmissions"] += 1
+                if node.attempts > 1:
+                    stats["retries"] += 1
+                tx = Transmission(node, time, time + data_airtime, False)
+
+            # Anything else on air destroys this and is destroyed by it
+            if on_air:
+                tx.collided = True
+                for other in on_air:
+                    other.collided = True
+            else:
+                busy_since = time
+            on_air.append(tx)
+            schedule(tx.end, TX_END, tx)
+
+        elif event_type == TX_END:
+            tx = data
+            on_air.remove(tx)
+            if not on_air:
+                airtime_used += time - busy_since
+
+            node = tx.node
+            if tx.is_ack:
+                if tx.collided:
+                    stats["acks_lost"] += 1
+                else:
+                    node.acked = True
+            else:
+                if tx.collided:
+                    stats["collisions"] += 1
+                else:
+                    if not node.received:
+                        # Retries of a packet that already got through are duplicates
+                        node.received = True
+                        stats["delivered"] += 1
+                    if scenario.ack:
+                        schedule(time + scenario.turnaround, TX_START, (node, True))
+
+                if scenario.ack:
+                    schedule(time + ack_timeout, ACK_TIMEOUT, node)
+                else:
+                    # Fire and forget
+                    node.busy = False
+                    if tx.collided:
+                        stats["failed"] += 1
+                        stats["attempts_histogram"][0] += 1 # The same as giving up when using acks
+                    else:
+                        stats["attempts_histogram"][1] += 1
+
+        elif event_type == ACK_TIMEOUT:
+            node = data
+            if node.acked:
+                node.busy = False
+                stats["acknowledged"] += 1
+                stats["attempts_histogram"][node.attempts] += 1
+            elif node.attempts < scenario.max_attempts:
+                delay = rng.uniform(0, back_off * node.attempts ** 3)
+                schedule(time + delay, TX_START, (node, False))
+            else:
+                node.busy = False
+                stats["failed"] += 1
+                stats["attempts_histogram"][0] += 1 # 0 is used for gave up
+
+    if on_air:
+        airtime_used += min(time, scenario.duration) - busy_since
+
+    sent = stats["generated"] - stats["dropped_busy"]
+    stats["scenario"] = vars(scenario)
+    stats["data_airtime"] = data_airtime
+    stats["ack_airtime"] = ack_airtime
+    stats["delivery_ratio"] = stats["delivered"] / stats["generated"] if stats["generated"] else 0
+    stats["delivery_ratio_sent"] = stats["delivered"] / sent if sent else 0
+    stats["retries_per_packet"] = stats["retries"] / sent if sent else 0
+    stats["channel_utilisation"] = airtime_used / scenario.duration
+    stats["offered_load"] = scenario.nodes * data_airtime / scenario.interval
+    return stats
+
+
+def run_scenarios(scenarios, workers=None) -> list:
+    """ Runs each scenario in parallel on a process pool and returns the results in the same order """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(simulate, scenarios))
+
+
+def parse_list(text, convert):
+    """ Converts a comma separated string of values into a list """
+    return [convert(value) for value in text.split(",")]
+
+
+def at_least_one(text) -> int:
+    """ argparse type for whole numbers that must be 1 or more """
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not {}".format(value))
+    return value
+
+
+def positive_list(text) -> list:
+    """ argparse type for comma separated numbers that must all be more than 0 """
+    values = parse_list(text, float)
+    for value in values:
+        if value <= 0:
+            raise argparse.ArgumentTypeError("must be more than 0, not {}".format(value))
+    return values
+
+
+def print_table(results) -> None:
+    """ Prints a summary of each result """
+    print("{:>6} {:>9} {:>3} {:>8} {:>10} {:>9} {:>10} {:>8} {:>8}".format(
+        "Nodes", "Interval", "SF", "Airtime", "Delivered", "Dropped", "Retries/pk", "Util.", "Load"))
+    for result in results:
+        scenario = result["scenario"]
+        print("{:>6} {:>8}s {:>3} {:>7.0f}ms {:>9.1f}% {:>9} {:>10.2f} {:>7.1f}% {:>7.1f}%".format(
+            scenario["nodes"], scenario["interval"], scenario["spread_factor"],
+            result["data_airtime"] * 1000, result["delivery_ratio"] * 100, result["dropped_busy"],
+            result["retries_per_packet"], result["channel_utilisation"] * 100,
+            result["offered_load"] * 100))
+
+
+def write_csv(filename, results) -> None:
+    """ Saves the results so they can be graphed elsewhere """
+    columns = ["nodes", "interval", "spread_factor", "payload_length", "ack"]
+    values = ["generated", "dropped_busy", "delivered", "acknowledged", "failed", "transmissions",
+              "retries", "collisions", "acks_lost", "delivery_ratio", "delivery_ratio_sent",
+              "retries_per_packet", "channel_utilisation", "offered_load"]
+    with open(filename, "w") as output:
+        output.write(",".join(columns + values) + "\n")
+        for result in results:
+            row = [result["scenario"][column] for column in columns]
+            row.extend(result[value] for value in values)
+            output.write(",".join(str(item) for item in row) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates many PJON over LoRa nodes sharing a channel.")
+    parser.add_argument("--nodes", default="5,10,20,50", help="Comma separated node counts")
+    parser.add_argument("--interval", type=positive_list, default="60,300", help="Comma separated seconds between packets")
+    parser.add_argument("--sf", default="7,9,12", help="Comma separated spreading factors")
+    parser.add_argument("--payload", type=int, default=10, help="Payload bytes per packet")
+    parser.add_argument("--duration", type=float, default=3600, help="Simulated seconds per run")
+    parser.add_argument("--max-attempts", type=at_least_one, default=5, help="Attempts before giving up")
+    parser.add_argument("--no-ack", action="store_true", help="Send without waiting for acknowledgements")
+    parser.add_argument("--poisson", action="store_true", help="Use random (Poisson) send times")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes to use")
+    parser.add_argument("--csv", help="Also save the results to this file")
+    args = parser.parse_args()
+
+    scenarios = []
+    for spread_factor in parse_list(args.sf, int):
+        if spread_factor < 7 or spread_factor > 12:
+            parser.error("{} is not a supported spreading factor (7 to 12)".format(spread_factor))
+        for interval in args.interval:
+            for nodes in parse_list(args.nodes, int):
+                scenarios.append(Scenario(nodes=nodes, interval=interval, spread_factor=spread_factor,
+                                          payload_length=args.payload, duration=args.duration,
+                                          ack=not args.no_ack, max_attempts=args.max_attempts,
+                                          poisson=args.poisson, seed=args.seed))
+
+    print("Running {} scenarios".format(len(scenarios)))
+    results = run_scenarios(scenarios, args.workers)
+    print_table(results)
+    if args.csv:
+        write_csv(args.csv, results)
+        print("Saved results to '{}'".format(args.csv))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+""" tune_converter.py
+A command line version of picaxe_tune.qml that does not need MuseScore to be running.
+Converts uncompressed (.mscx) and compressed (.mscz) MuseScore 3 scores into PICAXE tune commands.
+Whole directories of scores can be converted at once.
+
+Unlike the plugin, the speed and an octave offset are chosen automatically. The speed is picked so
+that the score's note lengths can be encoded in the fewest tune bytes (for example, a score with
+semiquavers is played twice as fast with every note twice as long) and the octave offset is
+picked so that as many notes as possible fit in the 3 octaves the tune command can play.
+
+Only the top note of each chord in the first voice of one staff is used and repeats are ignored,
+the same as the plugin.
+
+Created 19/10/2026
+https://github.com/jgOhYeah/PICAXE-Libraries-Extras
+"""
+import argparse
+import os
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from fractions import Fraction
+
+# Lengths of each duration type in quarter notes
+DURATION_TYPES = {
+    "long": Fraction(16),
+    "breve": Fraction(8),
+    "whole": Fraction(4),
+    "half": Fraction(2),
+    "quarter": Fraction(1),
+    "eighth": Fraction(1, 2),
+    "16th": Fraction(1, 4),
+    "32nd": Fraction(1, 8),
+    "64th": Fraction(1, 16),
+}
+
+# Note lengths the tune command supports (in quarter notes at the tune's speed) and their bits.
+# Longest first so that splitting long notes uses as few bytes as possible.
+TUNE_DURATIONS = [
+    (Fraction(4), 128), # Semibreve / whole
+    (Fraction(2), 192), # Minim / half
+    (Fraction(1), 0), # Crotchet / quarter
+    (Fraction(1, 2), 64), # Quaver / eighth
+]
+
+TUNE_REST = 15 # Same as the plugin
+TUNE_LOWEST = 60 # Lowest MIDI pitch in the tune command's range (C in the low octave)
+TUNE_HIGHEST = 95 # Highest MIDI pitch (B in the high octave)
+TUNE_BPM = 812 # Speed 1 is 812 beats per minute, speed 2 is 406, ...
+TUNE_MAX_SPEED = 15
+SCALES = [Fraction(1, 4), Fraction(1, 2), Fraction(1), Fraction(2), Fraction(4)]
+
+
+class ScoreError(Exception):
+    """ Raised when a score cannot be read """
+
+
+def open_score(filename: str):
+    """ Opens the .mscx file, or the .mscx file inside a .mscz file, for reading """
+    if filename.lower().endswith(".mscz"):
+        archive = zipfile.ZipFile(filename)
+        names = [name for name in archive.namelist() if name.lower().endswith(".mscx")]
+        if not names:
+            raise ScoreError("'{}' does not contain a .mscx file".format(filename))
+        # The score itself is in the root of the archive
+        names.sort(key=lambda name: name.count("/"))
+        return archive.open(names[0])
+    return open(filename, "rb")
+
+
+def read_notes(filename: str, staff_id: str = "1") -> tuple:
+    """ Reads the notes from a score using a streaming parser so that large scores do not need to
+    be loaded into memory all at once.
+    Returns a list of (pitch, length) tuples where pitch is the MIDI pitch or None for a rest and
+    length is in quarter notes, and the tempo in quarter notes per minute (None if not given). """
+    notes = []
+    tempo = None
+    path = [] # Tags of the elements we are currently inside
+    in_staff = False
+    voice = 0
+    tuplets = []
+
+    with open_score(filename) as file:
+        try:
+            for event, element in ElementTree.iterparse(file, events=("start", "end")):
+                tag = element.tag
+                if event == "start":
+                    path.append(tag)
+                    if tag == "Staff" and path[-2:-1] == ["Score"]:
+                        in_staff = element.get("id") == staff_id
+                    elif tag == "Measure":
+                        voice = 0
+                    elif tag == "voice":
+                        voice += 1
+                    continue
+
+                path.pop()
+                if not in_staff or voice != 1 or "voice" not in path and tag != "voice":
+                    if tag == "Measure":
+                        element.clear()
+                    continue
+
+                if tag == "Tempo" and tempo is None:
+                    tempo = float(element.findtext("tempo")) * 60
+                elif tag == "Tuplet" and path[-1] == "voice":
+                    ratio = Fraction(int(element.findtext("normalNotes")), int(element.findtext("actualNotes")))
+                    tuplets.append(ratio)
+                elif tag == "endTuplet" and tuplets:
+                    tuplets.pop()
+                elif tag in ("Chord", "Rest"):
+                    length = note_length(element)
+                    for ratio in tuplets:
+                        length *= ratio
+                    if tag == "Rest":
+                        notes.append((None, length))
+                    else:
+                        pitches = [int(note.findtext("pitch")) for note in element.iter("Note")]
+                        tied = any(spanner.get("type") == "Tie" and spanner.find("prev") is not None
+                                   for spanner in element.iter("Spanner"))
+                        if tied and notes and notes[-1][0] == max(pitches):
+                            # Continuation of a tied note
+                            notes[-1] = (notes[-1][0], notes[-1][1] + length)
+                        else:
+                            notes.append((max(pitches), length))
+                    element.clear()
+        except ElementTree.ParseError as error:
+            raise ScoreError("Could not read '{}': {}".format(filename, error))
+
+    return notes, tempo
+
+
+def note_length(element) -> Fraction:
+    """ Returns the length of a Chord or Rest element in quarter notes """
+    duration_type = element.findtext("durationType")
+    if duration_type == "measure":
+        numerator, denominator = element.findtext("duration", "4/4").split("/")
+        return Fraction(int(numerator) * 4, int(denominator))
+    if duration_type not in DURATION_TYPES:
+        raise ScoreError("Unknown note length '{}'".format(duration_type))
+
+    length = DURATION_TYPES[duration_type]
+    dots = int(element.findtext("dots", "0"))
+    return length * (2 - Fraction(1, 2**dots))
+
+
+def split_length(length: Fraction) -> tuple:
+    """ Splits a length in quarter notes at the tune's speed into tune durations.
+    Returns a list of duration bits and True if the length could not be represented exactly (any
+    remainder shorter than a quaver is rounded). """
+    parts = []
+    for size, bits in TUNE_DURATIONS:
+        while length >= size:
+            parts.append(bits)
+            length -= size
+    approximated = length != 0
+    if length >= TUNE_DURATIONS[-1][0] / 2 or not parts:
+        parts.append(TUNE_DURATIONS[-1][1])
+    return parts, approximated
+
+
+def pitch_code(pitch, octave_offset: int) -> tuple:
+    """ Returns the note and octave bits for a MIDI pitch and whether it had to be moved into the
+    range of the tune command. """
+    if pitch is None:
+        return TUNE_REST, False
+
+    pitch += 12 * octave_offset
+    moved = False
+    while pitch < TUNE_LOWEST:
+        pitch += 12
+        moved = True
+    while pitch > TUNE_HIGHEST:
+        pitch -= 12
+        moved = True
+
+    if pitch < 72:
+        octave = 32
+    elif pitch > 83:
+        octave = 16
+    else:
+        octave = 0
+    return pitch % 12 | octave, moved
+
+
+def choose_octave(notes: list) -> int:
+    """ Returns the octave offset that puts the most notes in range, preferring smaller offsets """
+    pitches = [pitch for pitch, _ in notes if pitch is not None]
+    if not pitches:
+        return 0
+
+    def out_of_range(offset):
+        return sum(1 for pitch in pitches if not TUNE_LOWEST <= pitch + 12 * offset <= TUNE_HIGHEST)
+
+    return min(range(-5, 6), key=lambda offset: (out_of_range(offset), abs(offset)))
+
+
+def encode(notes: list, scale: Fraction, octave_offset: int) -> dict:
+    """ Encodes the notes with each quarter note in the score becoming scale quarter notes in the
+    tune. Returns a dictionary with the bytes and how many notes were approximated or moved. """
+    data = []
+    approximated = 0
+    moved = 0
+    for pitch, length in notes:
+        code, was_moved = pitch_code(pitch, octave_offset)
+        parts, was_approximated = split_length(length * scale)
+        data.extend(code | bits for bits in parts)
+        approximated += was_approximated
+        moved += was_moved
+    return {"data": data, "approximated": approximated, "moved": moved}
+
+
+def optimise(notes: list, tempo, max_tempo_error: float = 0.1) -> dict:
+    """ Finds the speed, time scale and octave offset that give the fewest tune bytes.
+    Only speeds within max_tempo_error of the score's tempo are considered, unless none are.
+    Returns the best result from encode() with the speed, scale, octave offset and tempo error. """
+    if tempo is None:
+        tempo = 120 # MuseScore's default
+    octave_offset = choose_octave(notes)
+
+    candidates = []
+    for scale in SCALES:
+        speed = round(TUNE_BPM / (tempo * float(scale)))
+        if not 1 <= speed <= TUNE_MAX_SPEED:
+            continue
+        result = encode(notes, scale, octave_offset)
+        result["speed"] = speed
+        result["scale"] = scale
+        result["octave_offset"] = octave_offset
+        result["tempo_error"] = abs(TUNE_BPM / speed / float(scale) - tempo) / tempo
+        candidates.append(result)
+
+    if not candidates:
+        raise ScoreError("The tempo {:.0f} BPM cannot be played with any tune speed".format(tempo))
+    close = [result for result in candidates if result["tempo_error"] <= max_tempo_error] or candidates
+    return min(close, key=lambda result: (result["approximated"], len(result["data"]), result["tempo_error"]))
+
+
+def tune_command(result: dict, pin: str, name: str) -> str:
+    """ Formats the result as a tune command """
+    return "tune {}, {}, ({}) 'Converted from {}".format(pin, result["speed"], ",".join(str(i) for i in result["data"]), name)
+
+
+def convert(filename: str, pin: str = "C.2", staff_id: str = "1", max_tempo_error: float = 0.1) -> tuple:
+    """ Converts a score. Returns the code and the result from optimise() """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    notes, tempo = read_notes(filename, staff_id)
+    if not notes:
+        raise ScoreError("No notes found in staff {} of '{}'".format(staff_id, filename))
+    result = optimise(notes, tempo, max_tempo_error)
+
+    lines = [
+        "; {}.bas".format(name),
+        "; Converted from '{}' by tune_converter.py".format(os.path.basename(filename)),
+        "; Tempo error: {:.1f}%, octave offset: {}, each quarter note in the score is {} quarter notes in the tune.".format(
+            result["tempo_error"] * 100, result["octave_offset"], result["scale"]),
+    ]
+    if result["approximated"]:
+        lines.append("; WARNING: {} note lengths could not be represented exactly and were rounded.".format(result["approximated"]))
+    if result["moved"]:
+        lines.append("; WARNING: {} notes were out of range and were moved by an octave.".format(result["moved"]))
+    lines.append(tune_command(result, pin, name))
+    return "\n".join(lines) + "\n", result
+
+
+def find_scores(paths: list) -> list:
+    """ Returns every score file in the given files and directories """
+    scores = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                for file in sorted(files):
+                    if file.lower().endswith((".mscx", ".mscz")):
+                        scores.append(os.path.join(directory, file))
+        else:
+            scores.append(path)
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts MuseScore 3 scores into PICAXE tune commands.")
+    parser.add_argument("paths", nargs="+", help="Score files (.mscx or .mscz) or directories of them")
+    parser.add_argument("--pin", default="C.2", help="Pin to use in the tune command (default C.2)")
+    parser.add_argument("--staff", default="1", help="Staff number to convert (default 1)")
+    parser.add_argument("--max-tempo-error", type=float, default=10, help="Largest tempo error in percent allowed when choosing the speed (default 10)")
+    parser.add_argument("--output", help="Directory to save a .bas file for each score to. Printed if not given")
+    args = parser.parse_args()
+
+    scores = find_scores(args.paths)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    for score in scores:
+        try:
+            code, result = convert(score, args.pin, args.staff, args.max_tempo_error / 100)
+        except (ScoreError, OSError, zipfile.BadZipFile) as error:
+            print("Could not convert '{}': {}".format(score, error))
+            failed += 1
+            continue
+
+        if args.output:
+            name = os.path.splitext(os.path.basename(score))[0]
+            destination = os.path.join(args.output, name + ".bas")
+            with open(destination, "w") as file:
+                file.write(code)
+            print("Converted '{}' to '{}' ({} bytes, speed {})".format(score, destination, len(result["data"]), result["speed"]))
+        else:
+            print(code)
+
+    print("Converted {} of {} scores".format(len(scores) - failed, len(scores)))
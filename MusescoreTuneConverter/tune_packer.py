@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+""" tune_packer.py
+Packs several tunes into a library that stores repeated phrases only once.
+
+The tune command only accepts constants, so each tune normally takes up program memory for every
+note, even when tunes share the same phrases (or repeat phrases within themselves). The packer
+finds phrases that are repeated within and between tunes (with the same speed) and turns each
+phrase into a small subroutine containing a tune command. Each tune then becomes a list of phrase
+numbers stored in table memory, the data EEPROM or an external I2C EEPROM, which is played by the
+generated play_tune subroutine using on ... gosub.
+
+Phrases are picked greedily, repeatedly taking the phrase that saves the most program memory until
+no more savings can be made. Program memory sizes are estimates, so check the final size with the
+compiler.
+
+Tunes can be read from:
+ - .mscx and .mscz scores (converted with tune_converter.py).
+ - Any other text file containing tune commands, such as the output of picaxe_tune.qml or
+   tune_converter.py. Use --speed for tunes where the speed has been left as "speed".
+
+Created 19/10/2026
+https://github.com/jgOhYeah/PICAXE-Libraries-Extras
+"""
+import argparse
+import os
+import re
+import sys
+import zipfile
+
+from tune_converter import read_notes, optimise, find_scores, ScoreError
+
+# Estimated program memory used by each part (bytes)
+TUNE_OVERHEAD = 4 # Command, pin, speed and number of notes. Each note is another byte.
+PHRASE_OVERHEAD = 3 # return at the end of each phrase and its label in the on ... gosub list
+PLAYER_BYTES = 16 # play_tune without the on ... gosub labels
+I2C_PLAYER_BYTES = 12 # Setting up i2c for the right block before each read
+
+TUNE_END = 255 # Marks the end of each tune in the sequence data
+MAX_PHRASES = 255 # Phrase numbers 0 to 254
+STORAGE_SIZES = {"table": 512, "eeprom": 256, "i2c": 2048} # Largest on M2 parts / 24LC16
+STORAGE_READS = {
+    "table": "readtable {address}, {phrase}",
+    "eeprom": "read {address}, {phrase}",
+    "i2c": "hi2cin {address_low}, ({phrase})",
+}
+TUNE_PATTERN = re.compile(r"tune\s+[^,]+,\s*(\w+)\s*,\s*\(([\d\s,]*)\)(?:\s*'Converted from\s*(.+))?", re.IGNORECASE)
+
+
+class Tune:
+    """ A tune as a list of items, where each item is either a phrase number or a tuple of notes
+    that are only used here """
+    def __init__(self, name: str, speed: int, data: list):
+        self.name = name
+        self.speed = speed
+        self.data = list(data)
+        self.items = [tuple(data)] if data else []
+
+    def symbol(self) -> str:
+        return "TUNE_" + (re.sub(r"[\W_]+", "_", self.name).strip("_").upper() or "UNNAMED")
+
+
+def read_tunes(filename: str, default_speed: int = None, staff_id: str = "1", max_tempo_error: float = 0.1) -> list:
+    """ Returns the tunes in a score or a file containing tune commands """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if filename.lower().endswith((".mscx", ".mscz")):
+        notes, tempo = read_notes(filename, staff_id)
+        if not notes:
+            raise ScoreError("No notes found in staff {} of '{}'".format(staff_id, filename))
+        result = optimise(notes, tempo, max_tempo_error)
+        return [Tune(name, result["speed"], result["data"])]
+
+    tunes = []
+    with open(filename) as file:
+        lines = file.readlines()
+    matches = [match for match in (TUNE_PATTERN.search(line) for line in lines)
+               if match is not None and not re.search(r"[;']", match.string[:match.start()])] # Not commented out
+    for index, match in enumerate(matches):
+        speed, notes, converted_from = match.groups()
+        if speed.isdigit():
+            speed = int(speed)
+        elif default_speed is not None:
+            speed = default_speed
+        else:
+            raise ScoreError("The speed of the tune in '{}' is '{}'. Use --speed to set it".format(filename, speed))
+        data = [int(note) for note in notes.replace(" ", "").split(",") if note]
+        tune_name = converted_from.strip() if converted_from else "{}_{}".format(name, index + 1)
+        tunes.append(Tune(tune_name, speed, data))
+    if not tunes:
+        raise ScoreError("No tune commands found in '{}'".format(filename))
+    return tunes
+
+
+def find_occurrences(tunes: list, min_length: int, max_length: int) -> dict:
+    """ Returns every repeated run of notes in the unshared parts of the tunes as
+    (speed, notes): [(tune, item, position), ...] """
+    occurrences = {}
+    for tune_index, tune in enumerate(tunes):
+        for item_index, item in enumerate(tune.items):
+            if not isinstance(item, tuple):
+                continue
+            for length in range(min_length, min(max_length, len(item)) + 1):
+                for position in range(len(item) - length + 1):
+                    key = (tune.speed, item[position:position + length])
+                    occurrences.setdefault(key, []).append((tune_index, item_index, position))
+    return {key: found for key, found in occurrences.items() if len(found) > 1}
+
+
+def non_overlapping(found: list, length: int) -> dict:
+    """ Returns the positions that can be replaced in each item as {(tune, item): [positions]} """
+    result = {}
+    for tune_index, item_index, position in sorted(found):
+        positions = result.setdefault((tune_index, item_index), [])
+        if not positions or position >= positions[-1] + length:
+            positions.append(position)
+    return result
+
+
+def fragments(item: tuple, positions: list, length: int) -> list:
+    """ Returns the notes left over between the replaced positions """
+    pieces = []
+    start = 0
+    for position in positions:
+        pieces.append(item[start:position])
+        start = position + length
+    pieces.append(item[start:])
+    return [piece for piece in pieces if piece]
+
+
+def saving(tunes: list, notes: tuple, positions: dict) -> int:
+    """ Returns the program memory saved by making the notes a shared phrase """
+    count = sum(len(found) for found in positions.values())
+    if count < 2:
+        return 0
+    saved = count * len(notes) - (TUNE_OVERHEAD + PHRASE_OVERHEAD + len(notes))
+    for (tune_index, item_index), found in positions.items():
+        # Notes either side of the phrase become phrases of their own
+        pieces = len(fragments(tunes[tune_index].items[item_index], found, len(notes)))
+        saved -= (pieces - 1) * (TUNE_OVERHEAD + PHRASE_OVERHEAD)
+    return saved
+
+
+def pack(tunes: list, min_length: int = 3, max_length: int = 64) -> list:
+    """ Replaces repeated phrases in the tunes with phrase numbers, most program memory saved first.
+    Returns the shared phrases as (speed, notes). Everything left in tune.items that is still a
+    tuple of notes is given a phrase number by number_phrases(). """
+    shared = []
+    while len(shared) < MAX_PHRASES:
+        best = None
+        for (speed, notes), found in find_occurrences(tunes, min_length, max_length).items():
+            positions = non_overlapping(found, len(notes))
+            saved = saving(tunes, notes, positions)
+            if saved > 0 and (best is None or (saved, len(notes)) > (best[0], len(best[2]))):
+                best = (saved, speed, notes, positions)
+        if best is None:
+            break
+
+        _, speed, notes, positions = best
+        phrase = len(shared)
+        shared.append((speed, notes))
+        # Replace from the last item backwards so that the indices stay valid
+        for (tune_index, item_index), found in sorted(positions.items(), reverse=True):
+            tune = tunes[tune_index]
+            item = tune.items[item_index]
+            replacement = []
+            start = 0
+            for position in found:
+                if position > start:
+                    replacement.append(item[start:position])
+                replacement.append(phrase)
+                start = position + len(notes)
+            if start < len(item):
+                replacement.append(item[start:])
+            tune.items[item_index:item_index + 1] = replacement
+    return shared
+
+
+def number_phrases(tunes: list, shared: list) -> list:
+    """ Gives the notes that are only used once their own phrase numbers. Identical leftovers are
+    still only stored once. Returns every phrase as (speed, notes, names of the tunes that use it) """
+    phrases = [(speed, notes, []) for speed, notes in shared]
+    numbers = {(speed, notes): index for index, (speed, notes) in enumerate(shared)}
+    for tune in tunes:
+        for index, item in enumerate(tune.items):
+            if isinstance(item, tuple):
+                key = (tune.speed, item)
+                if key not in numbers:
+                    numbers[key] = len(phrases)
+                    phrases.append((tune.speed, item, []))
+                tune.items[index] = numbers[key]
+            if tune.name not in phrases[tune.items[index]][2]:
+                phrases[tune.items[index]][2].append(tune.name)
+    if len(phrases) > MAX_PHRASES:
+        raise ScoreError("{} phrases are needed but only {} can be played. Try a larger --min-phrase".format(len(phrases), MAX_PHRASES))
+    return phrases
+
+
+def sequence_data(tunes: list, offset: int) -> tuple:
+    """ Returns the sequence bytes and the start address of each tune """
+    data = []
+    starts = []
+    for tune in tunes:
+        starts.append(offset + len(data))
+        data.extend(tune.items)
+        data.append(TUNE_END)
+    return data, starts
+
+
+def estimate_sizes(tunes: list, phrases: list, storage: str) -> dict:
+    """ Estimates the program memory used with inline tune commands and the packed library """
+    inline = sum(TUNE_OVERHEAD + len(tune.data) for tune in tunes)
+    packed = PLAYER_BYTES + (I2C_PLAYER_BYTES if storage == "i2c" else 0)
+    packed += sum(TUNE_OVERHEAD + PHRASE_OVERHEAD + len(notes) for _, notes, _ in phrases)
+    return {"inline": inline, "packed": packed, "saved": inline - packed,
+            "sequence": sum(len(tune.items) + 1 for tune in tunes)}
+
+
+def low_byte(variable: str) -> str:
+    """ Returns the byte variable that is the low byte of a word variable (w3 -> b6) """
+    match = re.fullmatch(r"w(\d+)", variable.lower())
+    if match is None:
+        raise ValueError("'{}' is not a word variable (w0, w1...)".format(variable))
+    return "b{}".format(int(match.group(1)) * 2)
+
+
+def make_library(tunes: list, phrases: list, sizes: dict, data: list, starts: list, settings: dict) -> str:
+    """ Returns the code for the library """
+    storage = settings["storage"]
+    end_address = settings["offset"] + len(data) - 1
+    lines = [
+        "; Tune library generated by tune_packer.py from {} tunes".format(len(tunes)),
+        "; {} phrases are stored once each as subroutines. Each tune is a list of phrase numbers".format(len(phrases)),
+        "; stored in {} memory from {} to {}, ending with {}.".format(storage, settings["offset"], end_address, TUNE_END),
+        "; Estimated program memory: {} bytes as inline tune commands, {} bytes packed ({} bytes saved).".format(
+            sizes["inline"], sizes["packed"], sizes["saved"]),
+    ]
+    if storage == "i2c":
+        lines.append("; Upload the sequence data with: ./EEPROMTools.py c {} {} {}".format(
+            settings["offset"], end_address, os.path.basename(settings["image"])))
+        lines.append("; The I2C bus is set up for a 24LC16 EEPROM at 32MHz (see EEPROMTools.bas).")
+    lines += [
+        ";",
+        "; Usage:",
+        ";     tune_address = {}".format(tunes[0].symbol()),
+        ";     gosub play_tune",
+        "",
+        "symbol TUNE_PIN = {}".format(settings["pin"]),
+        "symbol tune_address = {}".format(settings["address"]),
+    ]
+    if storage == "i2c":
+        lines.append("symbol tune_address_low = {}".format(low_byte(settings["address"])))
+    lines += [
+        "symbol tune_phrase = {}".format(settings["phrase"]),
+        "symbol TUNE_END = {}".format(TUNE_END),
+    ]
+    for tune, start in zip(tunes, starts):
+        lines.append("symbol {} = {}".format(tune.symbol(), start))
+    lines.append("")
+
+    if storage != "i2c":
+        lines.append("{} {}, ({})".format("table" if storage == "table" else "eeprom", settings["offset"], ",".join(str(i) for i in data)))
+        lines.append("")
+
+    labels = ["tune_phrase_{}".format(index) for index in range(len(phrases))]
+    lines += [
+        "play_tune:",
+        "\t; Plays the tune starting at tune_address (one of the TUNE_ symbols above).",
+        "\t;",
+        "\t; Variables read: tune_address",
+        "\t; Variables modified: tune_address, tune_phrase",
+        "\t; Maximum stack depth used: 1",
+        "\tdo",
+    ]
+    if storage == "i2c":
+        lines += [
+            "\t\ttune_phrase = tune_address / 128 & %00001110 | %10100000 ; Block select bits",
+            "\t\thi2csetup i2cmaster, tune_phrase, i2cslow_32, i2cbyte",
+        ]
+    lines += [
+        "\t\t" + STORAGE_READS[storage].format(address="tune_address", address_low="tune_address_low", phrase="tune_phrase"),
+        "\t\tinc tune_address",
+        "\t\ton tune_phrase gosub {}".format(", ".join(labels)),
+        "\tloop while tune_phrase != TUNE_END",
+        "\treturn",
+    ]
+    for label, (speed, notes, used_by) in zip(labels, phrases):
+        lines += [
+            "",
+            "{}:".format(label),
+            "\t; Used by {}".format(", ".join(used_by)),
+            "\ttune TUNE_PIN, {}, ({})".format(speed, ",".join(str(i) for i in notes)),
+            "\treturn",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs several tunes into a library that only stores repeated phrases once.")
+    parser.add_argument("paths", nargs="+", help="Scores (.mscx or .mscz), files containing tune commands or directories of scores")
+    parser.add_argument("--output", default="tunes.basinc", help="Library to write (default tunes.basinc)")
+    parser.add_argument("--storage", choices=["table", "eeprom", "i2c"], default="table",
+                        help="Where to store the sequence of phrases for each tune (default table)")
+    parser.add_argument("--image", help="Binary image of the sequence data to upload with EEPROMTools.py (default OUTPUT.bin, only saved for i2c unless given)")
+    parser.add_argument("--offset", type=int, default=0, help="Address to start the sequence data at (default 0)")
+    parser.add_argument("--pin", default="C.2", help="Pin to use in the tune commands (default C.2)")
+    parser.add_argument("--speed", type=int, help="Speed for tunes where it was left as 'speed'")
+    # The defaults are not used by any of the libraries in this repository (the LoRa library leaves b12 to b19 free)
+    parser.add_argument("--address", default="w9", help="Variable to hold the sequence address (default w9, must be a word for i2c)")
+    parser.add_argument("--phrase", default="b17", help="Byte variable to hold the phrase number (default b17)")
+    parser.add_argument("--min-phrase", type=int, default=3, help="Shortest phrase in notes to share (default 3)")
+    parser.add_argument("--max-phrase", type=int, default=64, help="Longest phrase in notes to share (default 64)")
+    parser.add_argument("--staff", default="1", help="Staff number to convert in scores (default 1)")
+    parser.add_argument("--max-tempo-error", type=float, default=10, help="Largest tempo error in percent allowed when choosing the speed of scores (default 10)")
+    args = parser.parse_args()
+
+    tunes = []
+    try:
+        for path in find_scores(args.paths):
+            tunes += read_tunes(path, args.speed, args.staff, args.max_tempo_error / 100)
+    except (ScoreError, OSError, zipfile.BadZipFile) as error:
+        print("Could not read the tunes: {}".format(error))
+        sys.exit(1)
+
+    symbols = [tune.symbol() for tune in tunes]
+    for tune in tunes:
+        if symbols.count(tune.symbol()) > 1:
+            tune.name += "_{}".format(symbols[:tunes.index(tune) + 1].count(tune.symbol()))
+
+    try:
+        shared = pack(tunes, args.min_phrase, args.max_phrase)
+        phrases = number_phrases(tunes, shared)
+        if args.storage == "i2c":
+            low_byte(args.address)
+    except (ScoreError, ValueError) as error:
+        print(error)
+        sys.exit(1)
+
+    data, starts = sequence_data(tunes, args.offset)
+    if args.offset + len(data) > STORAGE_SIZES[args.storage]:
+        print("WARNING: The sequence data ends at {}, which is past the end of {} memory on most parts ({} bytes).".format(
+            args.offset + len(data) - 1, args.storage, STORAGE_SIZES[args.storage]))
+    sizes = estimate_sizes(tunes, phrases, args.storage)
+    settings = {"storage": args.storage, "offset": args.offset, "pin": args.pin, "address": args.address,
+                "phrase": args.phrase, "image": args.image or os.path.splitext(args.output)[0] + ".bin"}
+
+    with open(args.output, "w") as file:
+        file.write(make_library(tunes, phrases, sizes, data, starts, settings))
+    saved = [args.output]
+    if args.storage == "i2c" or args.image:
+        # The table and eeprom data is already in the library
+        with open(settings["image"], "wb") as file:
+            file.write(bytes(data))
+        saved.append(settings["image"])
+
+    for tune in tunes:
+        print("{:<40} speed {:>2}, {:>4} notes, {:>3} phrases".format(tune.name, tune.speed, len(tune.data), len(tune.items)))
+    print("{} shared phrases, {} phrases in total".format(len(shared), len(phrases)))
+    print("Estimated program memory: {} bytes inline, {} bytes packed, {} bytes saved".format(
+        sizes["inline"], sizes["packed"], sizes["saved"]))
+    if sizes["saved"] <= 0:
+        print("Not enough is repeated for packing to save anything. Inline tune commands will be smaller.")
+    print("Sequence data: {} bytes in {} memory. Saved {}".format(
+        len(data), args.storage, " and ".join("'{}'".format(name) for name in saved)))
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+""" Stand in for the PICAXE compilers for testing picaxe.py without them.
+Reports a size that only depends on the program so that the results of picaxe.py --size-report can
+be checked by hand. Each command is 2 bytes plus 1 for each comma. Blank lines, comments, labels,
+directives and symbol, table, eeprom and data lines are free.
+Fails the same way as a real compiler if a goto or gosub goes to a label that does not exist.
+
+Usage (from the Testing folder):
+    ../picaxe.py --compiler=stub_compiler.py --size-report HelloWorld.bas
+
+Created 19/10/2026
+"""
+import re
+import sys
+
+FREE = ["symbol", "table", "eeprom", "data"]
+AVAILABLE = 2048
+
+def get_workingline(line):
+    """ Returns the line without comments or surrounding whitespace """
+    return line.replace("'", ";").split(";")[0].strip()
+
+def compile_file(filename):
+    """ Returns the size of the program and a list of errors """
+    labels = set()
+    jumps = []
+    size = 0
+    with open(filename) as file:
+        for number, line in enumerate(file, 1):
+            workingline = get_workingline(line)
+            label = workingline.split(":")[0].strip()
+            if ":" in workingline and label.isidentifier():
+                labels.add(label.lower())
+                workingline = workingline.split(":", 1)[1].strip()
+
+            lower = workingline.lower()
+            words = re.split(r"[\s(,]", lower)
+            if lower == "" or lower.startswith("#") or words[0] in FREE:
+                continue
+
+            size += 2 + lower.count(",")
+            if words[0] in ("goto", "gosub"):
+                jumps.append((number, words[1]))
+
+    errors = ["line# {}, Error: label '{}' not defined".format(number, label)
+              for number, label in jumps if label not in labels]
+    return size, errors
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: stub_compiler.py [OPTION]... FILE.bas")
+        sys.exit(1)
+
+    size, errors = compile_file(sys.argv[-1])
+    if errors:
+        print("\n".join(errors))
+        sys.exit(1)
+
+    print("Memory used = {} bytes out of {}".format(size, AVAILABLE))
+    if "-s" not in sys.argv:
+        print("Download is not supported by the stub compiler")
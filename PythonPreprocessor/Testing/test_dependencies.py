@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+""" Checks the dependency file and include graph saved by picaxe.py --deps and --graph, and that
+include cycles are reported as errors. Each test makes a small include tree in a temporary folder
+and uses the stub compiler.
+
+Usage (from the Testing folder):
+    python3 -m unittest test_dependencies
+
+Created 19/10/2026
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+TESTING = os.path.dirname(os.path.abspath(__file__))
+PICAXE = os.path.join(TESTING, "..", "picaxe.py")
+
+# main.bas includes first.basinc and lib/second.basinc, which includes lib/third.basinc
+TREE = {
+    "main.bas": '#PICAXE 08M2\n#INCLUDE "first.basinc"\n#INCLUDE "lib/second.basinc"\nmain:\n\tgosub first_sub\n\tgoto main\n',
+    "first.basinc": "first_sub:\n\thigh C.1\n\treturn\n",
+    os.path.join("lib", "second.basinc"): '#INCLUDE "lib/third.basinc"\n',
+    os.path.join("lib", "third.basinc"): "symbol thing = b1\n",
+}
+
+class DependenciesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(TESTING, "stub_compiler.py"), self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_files(self, files):
+        for name, text in files.items():
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as file:
+                file.write(text)
+
+    def run_picaxe(self, *args):
+        return subprocess.run([sys.executable, PICAXE, "--compiler=stub_compiler.py", "-s"] + list(args),
+                              cwd=self.directory, capture_output=True, text=True)
+
+    def test_deps(self):
+        self.write_files(TREE)
+        os.mkdir(os.path.join(self.directory, "build"))
+        result = self.run_picaxe("--output=build/main.bas", "--deps", "main.bas")
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open(os.path.join(self.directory, "build", "main.d")) as file:
+            rules = file.read()
+        self.assertEqual(rules, "build/main.bas build/main.d: main.bas \\\n first.basinc \\\n lib/second.basinc \\\n lib/third.basinc\n"
+                                "\nfirst.basinc:\n\nlib/second.basinc:\n\nlib/third.basinc:\n")
+
+    def test_graph(self):
+        self.write_files(TREE)
+        result = self.run_picaxe("--graph=graph.json", "main.bas")
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open(os.path.join(self.directory, "graph.json")) as file:
+            graph = json.load(file)
+        self.assertEqual(graph["source"], "main.bas")
+        self.assertEqual(graph["chip"], "08m2")
+        second = os.path.normpath("lib/second.basinc")
+        third = os.path.normpath("lib/third.basinc")
+        includes = {name: entry["includes"] for name, entry in graph["files"].items()}
+        self.assertEqual(includes, {"main.bas": ["first.basinc", second], "first.basinc": [],
+                                    second: [third], third: []})
+        for name, entry in graph["files"].items():
+            with open(os.path.join(self.directory, name), "rb") as file:
+                self.assertEqual(entry["sha256"], hashlib.sha256(file.read()).hexdigest())
+
+    def test_include_cycle(self):
+        self.write_files({"first.bas": '#INCLUDE "second.basinc"\n', "second.basinc": '#INCLUDE "first.bas"\n'})
+        result = self.run_picaxe("--output=combined.bas", "--deps", "first.bas")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Include cycle found: first.bas -> second.basinc -> first.bas", result.stdout)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "combined.bas")))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "combined.d")))
+
+if __name__ == "__main__":
+    unittest.main()
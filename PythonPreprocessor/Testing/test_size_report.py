@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+""" Checks picaxe.py --size-report against the stub compiler.
+The test files are copied to a temporary folder first so that the compiled program saved in this
+folder is not overwritten.
+
+Usage (from the Testing folder):
+    python3 -m unittest test_size_report
+
+Created 19/10/2026
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+TESTING = os.path.dirname(os.path.abspath(__file__))
+PICAXE = os.path.join(TESTING, "..", "picaxe.py")
+FILES = ["HelloWorld.bas", "AnotherFile.basinc", "Symbols.basinc", "stub_compiler.py"]
+
+class SizeReportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in FILES:
+            shutil.copy(os.path.join(TESTING, name), self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_size_report(self):
+        """ Runs picaxe.py --size-report on HelloWorld.bas """
+        return subprocess.run([sys.executable, PICAXE, "--compiler=stub_compiler.py",
+                               "--size-report=sizes.json", "HelloWorld.bas"],
+                              cwd=self.directory, capture_output=True, text=True)
+
+    def test_sizes(self):
+        result = self.run_size_report()
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open(os.path.join(self.directory, "sizes.json")) as file:
+            report = json.load(file)
+        sections = {section["name"]: section["bytes"] for section in report["sections"]}
+        self.assertEqual(report["total"], 18)
+        self.assertEqual(report["available"], 2048)
+        self.assertEqual(report["main_file"], 14)
+        self.assertEqual(sections["main"], 8)
+        self.assertEqual(sections["AnotherFile.basinc"], 4)
+        self.assertEqual(sections["Symbols.basinc"], 0)
+        self.assertEqual(sections["high_led_sub"], 2)
+        self.assertEqual(sections["low_led_sub"], 2)
+
+    def test_compile_error(self):
+        """ A program that does not compile is an error and no report is saved """
+        with open(os.path.join(self.directory, "AnotherFile.basinc"), "a") as file:
+            file.write("\nbroken:\n\tgoto nowhere_in_particular\n")
+        result = self.run_size_report()
+        self.assertEqual(result.returncode, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "sizes.json")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,7 @@ This script merges all files into one and calls the correct compiler to process
 The compilers can be downloaded from the PICAXE website software section if needed, found at:
 www.picaxe.co.uk.
 
-Script written by Jotham Gates, last edited 02/12/2020. I have had nothing to do with the
+Script written by Jotham Gates, last edited 19/10/2026. I have had nothing to do with the
 compilers except using them to program PICAXE chips. Also, please be aware that I wrote this in my
 spare time to suit my own picaxe scripts, so there may be the odd bug.
 
@@ -19,16 +19,21 @@ issue. See the help text (run picaxe.py -h) for more usage info.
 Install location.
 For better or worse, I copied the script and compilers as follows so that I can access them without
 needing to remember file paths. Instead, I can just type in "picaxe.py" to run it. Edit
-compiler_path on line 43 to suit your needs. There may be a better or more appropriate place to
+compiler_path below to suit your needs. There may be a better or more appropriate place to
 locate these files.
 
 picaxe.py: /usr/local/bin/picaxe.py
 compilers: /usr/local/lib/picaxe/picaxe* (where * is 08, 08m, 08m2, ...)
 """
+import hashlib
+import json
 import os
+import re
 import sys
 import subprocess
-version = "1.0" # Version of this script
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+version = "1.1" # Version of this script
 
 # DEFAULTS AND SETTINGS
 # Default settings (May be overridden with the command line arguments)
@@ -38,12 +43,20 @@ chip = "08m2" # Must be lowercase m or x if included
 port = "-c/dev/ttyUSB0" # Must have "-c" with no space before like using the compiler as normal.
 src_file = ""
 dst_file = "picaxe_tmp_compiled.bas" # File to combine everything into before sending to the compiler
+size_report = None # JSON file to save the size report to if --size-report is given
+deps_file = None # Makefile style dependency file to save if --deps is given
+graph_file = None # JSON include graph to save if --graph is given
+profile = [] # Labels to add profiling markers to if --profile is given
+profile_pin = None # Pin to set high while in a profiled subroutine instead of using sertxd
+profile_map = None # JSON file describing the markers
+output = None # File being combined into, opened once the arguments have been read
 
 # Compiler path
 compiler_path = "/usr/local/lib/picaxe/" # Needs a / afterwards
 compiler_name = "picaxe"
 compiler_extension = "" # File extension. For linux anyway, there is none, but including just in
                         # case it is different for other platforms.
+compiler = None # Full path to the compiler if given with --compiler, otherwise built from the above.
 def show_help():
     """ Shows the help and usage window """
     print("""Simple preprocessor for PICAXE compilers.
@@ -74,6 +87,32 @@ Optional switches (similar to those in the PICAXE compilers)
     -p          Add pass message to error report file
     -h          Display this help
 
+Extra options for this preprocessor
+    --output=FILE
+                Combine everything into FILE (default picaxe_tmp_compiled.bas)
+    --deps[=FILE]
+                Save the files the program depends on in Makefile format
+                (default the output file with a .d extension)
+    --graph[=FILE]
+                Save the include graph and a hash of each file as JSON
+                (default the output file with a .json extension)
+    --size-report[=FILE]
+                Work out how many bytes of program memory each included file and
+                label uses instead of uploading. Prints a table and saves it as
+                JSON to FILE (default picaxe_size_report.json)
+    --compiler=FILE
+                Use this compiler instead of the one in compiler_path
+    --profile=LABEL[,LABEL]...
+                Send a byte with sertxd when entering and returning from each
+                subroutine given (or all called with gosub) for
+                profile_collector.py
+    --profile-pin=PIN
+                Set PIN high in the profiled subroutine instead of using sertxd
+                (one subroutine at a time)
+    --profile-map=FILE
+                Where to save the profiling marker codes (default the output
+                file with a .profile.json extension)
+
 Examples:
     14M2 chip on COM1 with AXE026 serial cable
         picaxe.py -v14m2 -c/dev/ttyS0 test.bas
@@ -82,6 +121,10 @@ Examples:
     A chip syntax check without download and the chip and port are specified
     using #PICAXE and #COM respectively in the file:
         picaxe.py -s test.bas
+    Which includes and labels are using the most memory:
+        picaxe.py --size-report test.bas
+    As part of a Makefile that only rebuilds when something has changed:
+        picaxe.py -s --output=build/test.bas --deps test.bas
 
 This is version {}.
 """.format(version))
@@ -108,8 +151,12 @@ def preprocessor_error(msg):
     if use_colour:
         print("\u001b[0m", end="") # Reset
 
-    output.close() # In case output was still open
-    exit()
+    if output is not None:
+        # Don't leave part of a program behind for make to think is up to date
+        output.close()
+        if os.path.exists(dst_file):
+            os.remove(dst_file)
+    sys.exit(1)
     
 def preprocessor_warning(msg):
     """ Prints a warning message. Similar to error, but will not stop. """
@@ -137,9 +184,19 @@ def set_chip(new_chip):
         preprocessor_error("""'{}' given as a PICAXE chip, but is not in the list of known parts or compilers.
 Please select from:\n{}""".format(new_chip,valid_chips))
 
+include_stack = [] # Files currently being combined, used to find include cycles
+include_graph = {} # Each file that has been combined and the files it includes, in order
+
 def combine(filename):
     """ Recursively combines PICAXE BASIC files into one """
     global port
+    name = os.path.normpath(filename)
+    if name in include_stack:
+        cycle = include_stack[include_stack.index(name):] + [name]
+        preprocessor_error("Include cycle found: {}".format(" -> ".join(cycle)))
+    include_stack.append(name)
+    include_graph.setdefault(name, [])
+
     # For each line in file, strip out ^M (\r).
     # If #include (convert to lower or uppercase) in line, then recursively call combine.
     try:
@@ -172,6 +229,9 @@ def combine(filename):
                 # There is not enough elements in the array for the include to be valid.
                 preprocessor_error("""Invalid #include statement: '{}'.
 Either there is no given file to include or it is not enclosed in quotation (\") marks.""".format(command))
+            included = os.path.normpath(broken_down[1])
+            if included not in include_graph[name]:
+                include_graph[name].append(included)
             combine(broken_down[1])
             output.write("; *** END OF INSERT ***\n\n")
 
@@ -198,6 +258,311 @@ The name of the port is not included""".format(command))
             output.write(filtered)
             output.write("\n")
 
+    include_stack.pop()
+
+def make_path(filename):
+    """ Returns the path to a file relative to where this script was run from, escaped for make """
+    path = os.path.relpath(os.path.abspath(filename), start_dir)
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+def write_deps(filename):
+    """ Saves a Makefile rule saying that the combined file (and this dependency file) need to be
+    remade when any of the files it was made from change. Every included file is also given an
+    empty rule so that make does not stop if one is deleted or renamed. """
+    files = [make_path(name) for name in include_graph]
+    with open(filename, "w") as file:
+        file.write("{} {}: {}\n".format(make_path(dst_file), make_path(filename), " \\\n ".join(files)))
+        for name in files[1:]:
+            file.write("\n{}:\n".format(name))
+
+def write_graph(filename):
+    """ Saves the files each file includes and the SHA-256 hash of each file as JSON. Paths are
+    relative to the folder the program is in. """
+    files = {}
+    for name, includes in include_graph.items():
+        with open(name, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        files[name] = {"sha256": digest, "includes": includes}
+
+    graph = {
+        "source": src_file_new,
+        "folder": working_dir,
+        "output": os.path.relpath(os.path.abspath(dst_file)),
+        "chip": chip,
+        "files": files,
+    }
+    with open(filename, "w") as file:
+        json.dump(graph, file, indent=4)
+
+PROFILE_FIRST_CODE = 0x80 # sertxd text is ASCII, so codes from here up will not be confused with it
+PROFILE_MAX = (256 - PROFILE_FIRST_CODE) // 2
+
+INSERT_START = "; *** INSERTED BELOW ***"
+INSERT_END = "; *** END OF INSERT ***"
+KEEP_WHEN_STUBBED = ["symbol", "table", "eeprom", "data"] # Commands that do not use program memory
+
+def get_workingline(line):
+    """ Returns the line without comments or surrounding whitespace """
+    return line.replace("'", ";").split(";")[0].strip()
+
+def get_label(workingline):
+    """ Returns the name of the label if the line is one, otherwise None.
+    Uses the same rule as variable_count.py. """
+    label = workingline.split(":")[0].strip()
+    if ":" in workingline and label.isidentifier():
+        return label
+    return None
+
+def find_sections(lines):
+    """ Finds each inserted file and each label in the combined program.
+    Returns a list of dictionaries with the type, name, file, depth and the first and last line
+    numbers (exclusive) of each. """
+    sections = []
+    files = [src_file_new] # Stack of the files currently being inserted
+    label = None
+    for number, line in enumerate(lines):
+        if line == INSERT_START:
+            # The commented out #include line is directly above this
+            name = lines[number - 1].split('"')[1]
+            if label is not None:
+                label["end"] = number - 1
+                label = None
+            sections.append({"type": "include", "name": name, "file": files[-1],
+                             "depth": len(files) - 1, "start": number + 1, "end": None})
+            files.append(name)
+        elif line == INSERT_END:
+            if label is not None:
+                label["end"] = number
+                label = None
+            # Close the most recent include that is still open
+            for section in reversed(sections):
+                if section["type"] == "include" and section["end"] is None:
+                    section["end"] = number
+                    break
+            files.pop()
+        else:
+            name = get_label(get_workingline(line))
+            if name is not None:
+                if label is not None:
+                    label["end"] = number
+                label = {"type": "label", "name": name, "file": files[-1], "depth": len(files) - 1,
+                         "start": number, "end": None}
+                sections.append(label)
+
+    if label is not None:
+        label["end"] = len(lines)
+    return sections
+
+def stub(lines, start, end):
+    """ Returns a copy of the program with the code between start and end removed.
+    Directives, symbols, data, macros and labels are kept so that everything else still compiles,
+    with each label becoming an empty subroutine. Line numbers are kept the same. """
+    result = lines[:start]
+    in_macro = False
+    for line in lines[start:end]:
+        workingline = get_workingline(line)
+        lower = workingline.lower()
+        label = get_label(workingline)
+        keep = lower.startswith("#") or re.split(r"[\s(,]", lower)[0] in KEEP_WHEN_STUBBED
+        if lower.startswith("#macro"):
+            in_macro = True
+        if in_macro or keep or line in (INSERT_START, INSERT_END):
+            result.append(line)
+        elif label is not None:
+            result.append("{}: return".format(label))
+        else:
+            result.append("")
+        if lower.startswith("#endmacro"):
+            in_macro = False
+    result.extend(lines[end:])
+    return result
+
+def compiler_command():
+    """ Returns the path to the compiler to use """
+    if compiler is not None:
+        return compiler
+    return "{}{}{}{}".format(compiler_path, compiler_name, chip, compiler_extension)
+
+def compiled_size(lines):
+    """ Syntax checks the program in a temporary folder and returns the number of bytes used, the
+    number of bytes available (None if not given) and the compiler's output. The size is None if
+    the program could not be compiled. """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, os.path.basename(dst_file))
+        with open(filename, "w") as file:
+            file.write("\n".join(lines))
+        try:
+            result = subprocess.run([compiler_command(), "-s", filename], capture_output=True,
+                                    text=True, cwd=directory)
+        except OSError as error:
+            return None, None, str(error)
+
+    message = result.stdout + result.stderr
+    match = re.search(r"memory used\s*=?\s*(\d+)(?:\D+?(\d+))?", message, re.IGNORECASE)
+    if match is None:
+        return None, None, message
+    size = int(match.group(1))
+    available = int(match.group(2)) if match.group(2) else None
+    return size, available, message
+
+def make_size_report(lines):
+    """ Compiles a copy of the program with each include and label removed in parallel and
+    attributes the difference in size to what was removed. Returns the report as a dictionary. """
+    sections = find_sections(lines)
+    variants = [lines] + [stub(lines, section["start"], section["end"]) for section in sections]
+    print("Compiling {} variants".format(len(variants)))
+    with ThreadPoolExecutor() as pool:
+        results = list(pool.map(compiled_size, variants))
+
+    total, available, message = results[0]
+    if total is None:
+        preprocessor_error("Could not get the size of the program from the compiler:\n{}".format(message))
+
+    for section, (size, _, message) in zip(sections, results[1:]):
+        if size is None:
+            # Usually a do / loop, if / endif or similar split by a label
+            section["bytes"] = None
+            section["error"] = message.strip()
+        else:
+            section["bytes"] = total - size
+
+    includes = [section["bytes"] or 0 for section in sections
+                if section["type"] == "include" and section["depth"] == 0]
+    return {
+        "source": src_file_new,
+        "chip": chip,
+        "total": total,
+        "available": available,
+        "main_file": total - sum(includes),
+        "sections": sections,
+    }
+
+def split_statements(code):
+    """ Splits the code on a line into statements at colons that are not in strings """
+    return [statement.strip() for statement in re.findall(r'(?:[^:"]|"[^"]*")+', code) if statement.strip()]
+
+def gosub_targets(lines):
+    """ Returns the lower case names of every label called with gosub or on ... gosub """
+    targets = set()
+    for line in lines:
+        for match in re.finditer(r"\bgosub\s+(\w+(?:\s*,\s*\w+)*)", get_workingline(line).lower()):
+            targets.update(name.strip() for name in match.group(1).split(","))
+    return targets
+
+def add_markers(line, entry, exit):
+    """ Adds the entry marker after the label on the line (if entry is not None) and the exit marker
+    before each return statement, including ones after a colon and in "if ... then return". Markers
+    are (statement, comment) tuples. Returns the new lines and the number of returns found. """
+    workingline = get_workingline(line)
+    label = get_label(workingline)
+    statements = split_statements(workingline)
+    if label is not None:
+        statements = statements[1:]
+    if label is None and len(statements) == 1 and statements[0].lower() == "return":
+        return ["\t{} ; {}".format(*exit), line], 1 # Return on its own
+    if label is not None and not statements:
+        return [line] + (["\t{} ; {}".format(*entry)] if entry else []), 0 # Label on its own
+
+    code = []
+    returns = 0
+    for statement in statements:
+        words = statement.lower().split()
+        if words == ["return"]:
+            code += [exit[0], statement]
+            returns += 1
+        elif words[0] == "if" and words[-2:] == ["then", "return"]:
+            code += [statement[:-len("return")].rstrip(), exit[0], "return", "endif"]
+            returns += 1
+        else:
+            code.append(statement)
+    if returns == 0 and entry is None:
+        return [line], 0
+
+    new = " : ".join(([entry[0]] if entry else []) + code)
+    if label is not None:
+        new = "{}: {}".format(label, new)
+    indent = line[:len(line) - len(line.lstrip())]
+    comment = line[len(line.replace("'", ";").split(";")[0]):].strip()
+    return ["{}{} {}".format(indent, new, comment).rstrip()], returns
+
+def add_profiling(lines, names):
+    """ Adds markers after each profiled label and before each return up to the next label.
+    Labels are found the same way as the size report and variable_count.py, so a subroutine that
+    returns from code after another label (or drops through into it) will not be timed correctly.
+    "all" profiles every label that is called with gosub (and the interrupt routine).
+    Returns the new lines and a dictionary describing the markers. """
+    labels = [section for section in find_sections(lines) if section["type"] == "label"]
+    targets = gosub_targets(lines) | {"interrupt"}
+    if names == ["all"]:
+        # Anything else never returns and would stay on profile_collector.py's stack
+        names = [label["name"] for label in labels if label["name"].lower() in targets]
+    wanted = [name.lower() for name in names]
+    chosen = [label for label in labels if label["name"].lower() in wanted]
+
+    missing = set(wanted) - set(label["name"].lower() for label in chosen)
+    if missing:
+        preprocessor_error("Cannot profile labels that do not exist: {}".format(", ".join(sorted(missing))))
+    if profile_pin is None and len(chosen) > PROFILE_MAX:
+        preprocessor_error("Only {} subroutines can be profiled at once using sertxd.".format(PROFILE_MAX))
+    if profile_pin is not None and len(chosen) > 1:
+        preprocessor_error("""Only one subroutine can be profiled at a time with --profile-pin.
+A subroutine returning would set the pin low while whatever called it is still running.""")
+    for label in chosen:
+        if label["name"].lower() not in targets:
+            preprocessor_warning("'{}' is never called with gosub, so it may never return.".format(label["name"]))
+
+    replaced = {} # Line number: lines to use instead
+    subroutines = []
+    for index, label in enumerate(chosen):
+        if profile_pin is None:
+            code = PROFILE_FIRST_CODE + 2 * index
+            entry_marker = ("sertxd({})".format(code), "Profiling: enter {}".format(label["name"]))
+            exit_marker = ("sertxd({})".format(code + 1), "Profiling: return from {}".format(label["name"]))
+            subroutines.append({"name": label["name"], "file": label["file"], "entry": code, "exit": code + 1})
+        else:
+            entry_marker = ("high {}".format(profile_pin), "Profiling: enter {}".format(label["name"]))
+            exit_marker = ("low {}".format(profile_pin), "Profiling: return from {}".format(label["name"]))
+            subroutines.append({"name": label["name"], "file": label["file"]})
+
+        returns = 0
+        for number in range(label["start"], label["end"]):
+            entry = entry_marker if number == label["start"] else None
+            replaced[number], found = add_markers(lines[number], entry, exit_marker)
+            returns += found
+        if returns == 0:
+            preprocessor_warning("'{}' has no return before the next label, so no time will be recorded for it.".format(label["name"]))
+
+    result = []
+    for number, line in enumerate(lines):
+        result.extend(replaced.get(number, [line]))
+
+    return result, {"mode": "sertxd" if profile_pin is None else "pin", "pin": profile_pin,
+                    "source": src_file_new, "subroutines": subroutines}
+
+def print_size_report(report):
+    """ Prints the sections in the report sorted from largest to smallest """
+    if report["available"]:
+        print("Total: {} of {} bytes ({:.1f}%)".format(report["total"], report["available"],
+                                                     report["total"] / report["available"] * 100))
+    else:
+        print("Total: {} bytes".format(report["total"]))
+    print("{} excluding includes: {} bytes".format(report["source"], report["main_file"]))
+    print()
+    print("{:>6} {:>6}  {:<8} {:<32} {}".format("Bytes", "%", "Type", "Name", "In"))
+    ordered = sorted(report["sections"], key=lambda section: -1 if section["bytes"] is None else section["bytes"], reverse=True)
+    for section in ordered:
+        if section["bytes"] is None:
+            size, percent = "?", "?"
+        else:
+            size = str(section["bytes"])
+            percent = "{:.1f}".format(section["bytes"] / report["total"] * 100)
+        name = "  " * section["depth"] + section["name"]
+        print("{:>6} {:>6}  {:<8} {:<32} {}".format(size, percent, section["type"], name, section["file"]))
+
+    failed = [section for section in report["sections"] if section["bytes"] is None]
+    if failed:
+        preprocessor_warning("{} sections could not be compiled on their own and are marked '?'.".format(len(failed)))
+
 # Command line options
 if len(sys.argv) == 1:
     # No arguments given
@@ -207,7 +572,40 @@ if len(sys.argv) == 1:
 command = [""] # Empty string at the first position will be replaced by the compiler name and path.
 for i in range(1, len(sys.argv)):
     arg = sys.argv[i]
-    if arg[:2] == "-c":
+    if arg == "--size-report":
+        size_report = os.path.abspath("picaxe_size_report.json")
+
+    elif arg.startswith("--size-report="):
+        size_report = os.path.abspath(arg[14:])
+
+    elif arg.startswith("--compiler="):
+        compiler = os.path.abspath(arg[11:])
+
+    elif arg.startswith("--profile="):
+        profile = [name.strip() for name in arg[10:].split(",") if name.strip()]
+
+    elif arg.startswith("--profile-pin="):
+        profile_pin = arg[14:]
+
+    elif arg.startswith("--profile-map="):
+        profile_map = os.path.abspath(arg[14:])
+
+    elif arg.startswith("--output="):
+        dst_file = os.path.abspath(arg[9:])
+
+    elif arg == "--deps":
+        deps_file = "" # Named after the output file once it is known
+
+    elif arg.startswith("--deps="):
+        deps_file = os.path.abspath(arg[7:])
+
+    elif arg == "--graph":
+        graph_file = ""
+
+    elif arg.startswith("--graph="):
+        graph_file = os.path.abspath(arg[8:])
+
+    elif arg[:2] == "-c":
         # Serial port
         port = arg
     
@@ -234,6 +632,7 @@ for i in range(1, len(sys.argv)):
 
 # Changing directory
 # Getting path code from https://stackoverflow.com/a/17057603
+start_dir = os.getcwd()
 working_dir, src_file_new = os.path.split(os.path.abspath(src_file))
 os.chdir(working_dir)
 output = open(dst_file,"w") # Array of lines of the finished program.
@@ -243,11 +642,44 @@ combine(src_file_new)
 
 # Finishing up
 output.close()
+if deps_file is not None:
+    if deps_file == "":
+        deps_file = os.path.splitext(dst_file)[0] + ".d"
+    write_deps(deps_file)
+    print("Saved dependencies to '{}'".format(deps_file))
+if graph_file is not None:
+    if graph_file == "":
+        graph_file = os.path.splitext(dst_file)[0] + ".json"
+    write_graph(graph_file)
+    print("Saved the include graph to '{}'".format(graph_file))
+
+if profile:
+    with open(dst_file) as file:
+        lines, markers = add_profiling(file.read().split("\n"), profile)
+    with open(dst_file, "w") as file:
+        file.write("\n".join(lines))
+    if profile_map is None:
+        profile_map = os.path.splitext(dst_file)[0] + ".profile.json"
+    with open(profile_map, "w") as file:
+        json.dump(markers, file, indent=4)
+    print("Profiling {} subroutines. Saved the markers to '{}'".format(len(markers["subroutines"]), profile_map))
+
+if size_report is not None:
+    print("Preprocessor done. Working out the size of each part")
+    with open(dst_file) as file:
+        report = make_size_report(file.read().split("\n"))
+    print_size_report(report)
+    with open(size_report, "w") as file:
+        json.dump(report, file, indent=4)
+    print("Saved the size report to '{}'".format(size_report))
+    exit()
+
 print("Preprocessor done. Passing over to the compiler")
 # Calling the correct compiler
-command[0] = "{}{}{}{}".format(compiler_path, compiler_name, chip, compiler_extension)
+command[0] = compiler_command()
 command.append(port)
 command.append(dst_file)
-subprocess.run(command)
+result = subprocess.run(command)
 
-print("Finished.")
\ No newline at end of file
+print("Finished.")
+sys.exit(result.returncode) # So that make can tell if it failed
\ No newline at end of file
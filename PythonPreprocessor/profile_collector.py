@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Collects the markers sent by a program built with picaxe.py --profile and reports how many times
+each subroutine was called and how long it took.
+
+Each marker byte is timestamped from when the chunk it arrived in was received, working backwards
+from the end of the chunk by the time taken to send each byte. USB serial adaptors hold on to
+bytes for a while before passing them on (16ms by default for FTDI chips), so set the latency
+timer as low as possible for the most accurate times:
+    echo 1 > /sys/bus/usb-serial/devices/ttyUSB0/latency_timer
+Sending each marker also takes time on the PICAXE (about 0.26ms at 38400 baud), which is included
+in the times of any subroutines that call profiled subroutines.
+
+Created 19/10/2026
+Modified 19/10/2026
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+CHUNK_SIZE = 4096 # Largest number of bytes to read at once
+BITS_PER_BYTE = 10 # Start, 8 data and stop bits
+
+class Profile:
+    """ Call counts and times for a single subroutine """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.unfinished = 0 # Entered but never returned (or returned without a marker)
+        self.times = [] # Seconds
+
+    def histogram(self) -> dict:
+        """ Returns the number of calls that took between 2^n and 2^(n+1) microseconds for each n """
+        buckets = {}
+        for duration in self.times:
+            bucket = int(math.log2(duration * 1e6)) if duration > 1e-6 else 0
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+        return dict(sorted(buckets.items()))
+
+    def summary(self) -> dict:
+        """ Returns the results as a dictionary that can be saved as JSON """
+        result = {"calls": self.calls, "unfinished": self.unfinished, "timed": len(self.times)}
+        if self.times:
+            result["total_ms"] = sum(self.times) * 1000
+            result["mean_ms"] = result["total_ms"] / len(self.times)
+            result["min_ms"] = min(self.times) * 1000
+            result["max_ms"] = max(self.times) * 1000
+            result["histogram_us"] = {"{}-{}".format(2**bucket, 2**(bucket + 1)): count
+                                      for bucket, count in self.histogram().items()}
+        return result
+
+class Collector:
+    """ Matches entry and exit markers to time each call """
+    def __init__(self, markers: dict, baud: int = 38400):
+        self.byte_time = BITS_PER_BYTE / baud
+        self.profiles = {}
+        self.entries = {} # Marker code: profile
+        self.exits = {}
+        for subroutine in markers["subroutines"]:
+            profile = Profile(subroutine["name"])
+            self.profiles[subroutine["name"]] = profile
+            self.entries[subroutine["entry"]] = profile
+            self.exits[subroutine["exit"]] = profile
+        self.stack = [] # (profile, entry time) of the calls that have not returned yet
+        self.unknown = 0
+        self.text = bytearray() # Anything else sent with sertxd
+
+    def feed(self, data: bytes, received: float) -> None:
+        """ Processes a chunk of bytes where the last byte was received at the given time """
+        for index, byte in enumerate(data):
+            if byte < 0x80:
+                self.text.append(byte)
+                continue
+
+            sent = received - (len(data) - 1 - index) * self.byte_time
+            if byte in self.entries:
+                profile = self.entries[byte]
+                profile.calls += 1
+                self.stack.append((profile, sent))
+            elif byte in self.exits:
+                self._returned(self.exits[byte], sent)
+            else:
+                self.unknown += 1
+
+    def _returned(self, profile: Profile, sent: float) -> None:
+        """ Finds the call this return belongs to """
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][0] is profile:
+                # Anything called after it that did not return is unfinished
+                for unfinished, _ in self.stack[depth + 1:]:
+                    unfinished.unfinished += 1
+                profile.times.append(sent - self.stack[depth][1])
+                del self.stack[depth:]
+                return
+        profile.unfinished += 1 # Returned without entering (dropped through or started mid call)
+
+    def report(self) -> dict:
+        """ Returns the results for every subroutine """
+        for profile, _ in self.stack:
+            profile.unfinished += 1
+        self.stack.clear()
+        return {name: profile.summary() for name, profile in self.profiles.items()}
+
+def print_report(report: dict, histograms: bool = True) -> None:
+    """ Prints a table of the results sorted by the total time spent in each subroutine """
+    print("{:<28} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "Subroutine", "Calls", "Unfinished", "Total ms", "Mean ms", "Min ms", "Max ms"))
+    ordered = sorted(report.items(), key=lambda item: item[1].get("total_ms", 0), reverse=True)
+    for name, result in ordered:
+        if "total_ms" in result:
+            print("{:<28} {:>8} {:>10} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                name, result["calls"], result["unfinished"], result["total_ms"], result["mean_ms"],
+                result["min_ms"], result["max_ms"]))
+        else:
+            print("{:<28} {:>8} {:>10}".format(name, result["calls"], result["unfinished"]))
+
+    if histograms:
+        for name, result in ordered:
+            if "histogram_us" not in result:
+                continue
+            print()
+            print("{} (microseconds)".format(name))
+            largest = max(result["histogram_us"].values())
+            for bucket, count in result["histogram_us"].items():
+                print("{:>16} {:>8} {}".format(bucket, count, "#" * math.ceil(count / largest * 40)))
+
+def read_recording(filename: str):
+    """ Yields the (bytes, time received) chunks saved with --record """
+    with open(filename) as file:
+        for line in file:
+            received, _, data = line.strip().partition(" ")
+            if received:
+                yield bytes.fromhex(data), float(received)
+
+def read_serial(port: str, baud: int, duration, record=None):
+    """ Yields chunks from the serial port until the duration (if given) has passed """
+    import serial # Only needed when reading from the serial port
+    ser = serial.Serial(port, baud, timeout=0.1)
+    start = time.time()
+    try:
+        while duration is None or time.time() - start < duration:
+            data = ser.read(min(max(ser.in_waiting, 1), CHUNK_SIZE))
+            received = time.time()
+            if data:
+                if record is not None:
+                    record.write("{:.6f} {}\n".format(received, data.hex()))
+                yield data, received
+    finally:
+        ser.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports subroutine call counts and times from a program built with picaxe.py --profile.")
+    parser.add_argument("map", help="Markers file saved by picaxe.py (*.profile.json)")
+    parser.add_argument("--port", default="/dev/ttyUSB0", help="Serial port (default /dev/ttyUSB0)")
+    parser.add_argument("--baud", type=int, default=38400, help="Baud rate (default 38400)")
+    parser.add_argument("--duration", type=float, help="Seconds to collect for. Press Ctrl+C to stop if not given")
+    parser.add_argument("--record", help="Save what was received to this file so it can be analysed again with --input")
+    parser.add_argument("--input", help="Analyse a file saved with --record instead of reading from the serial port")
+    parser.add_argument("--json", help="Also save the results to this file")
+    parser.add_argument("--no-histograms", action="store_true", help="Only print the table")
+    parser.add_argument("--echo", action="store_true", help="Print any other text sent with sertxd at the end")
+    args = parser.parse_args()
+
+    with open(args.map) as file:
+        markers = json.load(file)
+    if markers["mode"] != "sertxd":
+        print("The program was profiled using pin {}. Use a logic analyser or oscilloscope to time it.".format(markers["pin"]))
+        sys.exit(1)
+
+    collector = Collector(markers, args.baud)
+    record = open(args.record, "w") if args.record else None
+    if args.input:
+        chunks = read_recording(args.input)
+    else:
+        chunks = read_serial(args.port, args.baud, args.duration, record)
+        print("Collecting from {}. Press Ctrl+C to stop.".format(args.port), file=sys.stderr)
+
+    try:
+        for data, received in chunks:
+            collector.feed(data, received)
+    except KeyboardInterrupt:
+        pass
+    if record is not None:
+        record.close()
+
+    report = collector.report()
+    if args.echo and collector.text:
+        print(collector.text.decode("ascii", "backslashreplace"))
+    if collector.unknown:
+        print("{} bytes did not match any marker".format(collector.unknown))
+    print_report(report, not args.no_histograms)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=4)
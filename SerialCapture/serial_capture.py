@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Captures sertxd output from a PICAXE microcontroller for long periods of time.
+Each line is saved with the time it was received into log files that are compressed once they get
+too large. Binary debug frames mixed in with the text can optionally be decoded.
+
+Frame format:
+    0xA5, id, length, payload (length bytes), crc8
+The crc8 is the same as PJON uses (polynomial 0x97) and covers the id, length and payload, so
+crc8_compute in PJON.basinc can be used to send frames. 0xA5 is never sent as text, so frames can
+be found in amongst sertxd text.
+
+Bytes are read from the serial port in large chunks by a separate thread and passed to the main
+thread through a queue, so that compressing old log files never causes bytes to be dropped.
+
+Created 19/10/2026
+Modified 19/10/2026
+"""
+import argparse
+import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import signal
+import struct
+import sys
+import threading
+import time
+
+FRAME_SYNC = 0xA5
+FRAME_OVERHEAD = 4 # Sync, id, length and crc
+FRAME_MAX_PAYLOAD = 64 # Anything longer is assumed to be text with a stray sync byte
+CHUNK_SIZE = 4096 # Largest number of bytes to read at once
+READ_TIMEOUT = 0.1 # Seconds to wait for bytes before checking if stopped
+
+def crc8(data: bytes, crc: int = 0) -> int:
+    """ CRC8 implementation from the Arduino PJON library, the same as crc8_compute in PJON.basinc """
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 0x01
+            crc >>= 1
+            if mix:
+                crc ^= 0x97
+            byte >>= 1
+    return crc
+
+def make_frame(frame_id: int, payload: bytes) -> bytes:
+    """ Builds a frame. Handy for testing """
+    body = bytes([frame_id, len(payload)]) + payload
+    return bytes([FRAME_SYNC]) + body + bytes([crc8(body)])
+
+class StreamDecoder:
+    """ Splits received bytes into timestamped lines and (optionally) frames """
+    def __init__(self, frames: bool = False):
+        self.frames = frames
+        self.buffer = bytearray()
+        self.line = bytearray()
+        self.line_time = None # Time the first byte of the current line was received
+        self.crc_errors = 0
+
+    def feed(self, data: bytes, received: float, final: bool = False) -> list:
+        """ Adds bytes received at the given time (None if not known) and returns a list of
+        completed records. Each record is ("line", time, text) or ("frame", time, id, payload).
+        If final is True, incomplete frames are treated as text instead of waiting for more. """
+        self.buffer += data
+        records = []
+        position = 0
+        while position < len(self.buffer):
+            if self.frames and self.buffer[position] == FRAME_SYNC:
+                end = None
+                if position + 3 <= len(self.buffer) and self.buffer[position + 2] <= FRAME_MAX_PAYLOAD:
+                    end = position + FRAME_OVERHEAD + self.buffer[position + 2]
+                    if end <= len(self.buffer):
+                        body = bytes(self.buffer[position + 1:end - 1])
+                        if crc8(body) == self.buffer[end - 1]:
+                            records.append(("frame", received, body[0], body[2:]))
+                            position = end
+                            continue
+                        # Not a frame after all. Keep the byte as text and look for the next one.
+                        self.crc_errors += 1
+                        end = None
+                    elif not final:
+                        break # Need the rest of the frame
+                elif position + 3 > len(self.buffer) and not final:
+                    break # Need the length
+
+            byte = self.buffer[position]
+            position += 1
+            if self.line_time is None:
+                self.line_time = received
+            if byte == ord("\n"):
+                records.append(self._end_line())
+            elif byte != ord("\r"):
+                self.line.append(byte)
+
+        del self.buffer[:position]
+        return records
+
+    def flush(self, received: float = None) -> list:
+        """ Returns anything left over """
+        records = self.feed(b"", received, final=True)
+        if self.line:
+            records.append(self._end_line())
+        return records
+
+    def _end_line(self) -> tuple:
+        """ Returns the current line as a record and starts a new one """
+        record = ("line", self.line_time, self.line.decode("ascii", "backslashreplace"))
+        self.line.clear()
+        self.line_time = None
+        return record
+
+def gzip_rotator(source: str, destination: str) -> None:
+    """ Compresses a log file that has just filled up """
+    with open(source, "rb") as file_in, gzip.open(destination, "wb") as file_out:
+        shutil.copyfileobj(file_in, file_out)
+    os.remove(source)
+
+def open_log(filename: str, max_bytes: int, backups: int) -> logging.Logger:
+    """ Returns a logger that writes to filename, moving it to filename.1.gz, filename.2.gz...
+    once it is max_bytes long """
+    handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backups)
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = gzip_rotator
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger("serial_capture")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+def parse_frame_formats(formats: list) -> dict:
+    """ Converts a list of "id:format" strings into a dictionary of id: struct.Struct """
+    result = {}
+    for item in formats:
+        frame_id, _, layout = item.partition(":")
+        result[int(frame_id, 0)] = struct.Struct(layout)
+    return result
+
+def format_record(record: tuple, frame_formats: dict) -> str:
+    """ Formats a record from StreamDecoder as a line of the log. Records without a time (from a
+    replayed raw capture) have no timestamp. """
+    if record[1] is None:
+        timestamp = ""
+    else:
+        timestamp = datetime.datetime.fromtimestamp(record[1]).isoformat(timespec="milliseconds") + " "
+    if record[0] == "line":
+        return "{}{}".format(timestamp, record[2])
+
+    _, _, frame_id, payload = record
+    text = "{}FRAME {} [{}]".format(timestamp, frame_id, payload.hex(" "))
+    layout = frame_formats.get(frame_id)
+    if layout is not None and layout.size == len(payload):
+        text += " " + " ".join(str(value) for value in layout.unpack(payload))
+    return text
+
+def reader(ser, chunks: queue.Queue, stop: threading.Event, raw=None) -> None:
+    """ Reads everything available from the serial port in large chunks until stopped """
+    while not stop.is_set():
+        data = ser.read(min(max(ser.in_waiting, 1), CHUNK_SIZE))
+        if data:
+            chunks.put((data, time.time()))
+            if raw is not None:
+                raw.write(data)
+    chunks.put(None)
+
+def file_reader(filename: str, chunks: queue.Queue, stop: threading.Event) -> None:
+    """ Reads a raw capture (for decoding old captures). Raw captures do not store when each byte
+    was received, so the chunks have no time. """
+    with open_raw(filename, "rb") as file:
+        while not stop.is_set():
+            data = file.read(CHUNK_SIZE)
+            if not data:
+                break
+            chunks.put((data, None))
+    chunks.put(None)
+
+def open_raw(filename: str, mode: str):
+    """ Opens a raw capture, compressed if it ends in .gz """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+def stop_on_interrupt(stop: threading.Event) -> None:
+    """ Makes Ctrl+C stop the reader instead of interrupting the main thread part way through a
+    chunk, so that everything already received is still logged. Pressing it again stops straight
+    away. """
+    def handler(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        print("Stopping. Press Ctrl+C again to stop without logging the rest.", file=sys.stderr)
+        stop.set()
+    signal.signal(signal.SIGINT, handler)
+
+def new_stats() -> dict:
+    """ Statistics for a whole capture, added to by capture() """
+    return {"bytes": 0, "lines": 0, "frames": 0, "largest_backlog": 0, "crc_errors": 0}
+
+def capture(chunks: queue.Queue, decoder: StreamDecoder, logger: logging.Logger, frame_formats: dict,
+            stats: dict, echo: bool = True) -> None:
+    """ Decodes and logs chunks from the queue until None is received, adding to stats """
+    received = None
+    while True:
+        stats["largest_backlog"] = max(stats["largest_backlog"], chunks.qsize())
+        item = chunks.get()
+        if item is None:
+            records = decoder.flush(received)
+        else:
+            data, received = item
+            stats["bytes"] += len(data)
+            records = decoder.feed(data, received)
+
+        for record in records:
+            stats[record[0] + "s"] += 1
+            text = format_record(record, frame_formats)
+            logger.info(text)
+            if echo:
+                print(text)
+
+        if item is None:
+            break
+    stats["crc_errors"] = decoder.crc_errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captures sertxd output from a PICAXE to rotating compressed logs.")
+    parser.add_argument("--port", default="/dev/ttyUSB0", help="Serial port (default /dev/ttyUSB0)")
+    parser.add_argument("--baud", type=int, default=38400, help="Baud rate (default 38400, sertxd at 32MHz)")
+    parser.add_argument("--output", default="capture.log", help="Log file to write (default capture.log)")
+    parser.add_argument("--max-size", type=float, default=10, help="Megabytes before the log is compressed and a new one started (default 10)")
+    parser.add_argument("--backups", type=int, default=100, help="Number of compressed logs to keep (default 100)")
+    parser.add_argument("--frames", action="store_true", help="Decode binary debug frames")
+    parser.add_argument("--frame-format", action="append", default=[], metavar="ID:FORMAT",
+                        help="Python struct format to unpack frames with this id, for example 1:<Hh. Can be given more than once")
+    parser.add_argument("--raw", help="Also save every byte received to this file (compressed if it ends in .gz)")
+    parser.add_argument("--input", help="Decode a raw capture instead of reading from the serial port")
+    parser.add_argument("--quiet", action="store_true", help="Do not print each line as well")
+    args = parser.parse_args()
+
+    logger = open_log(args.output, int(args.max_size * 1e6), args.backups)
+    decoder = StreamDecoder(args.frames)
+    frame_formats = parse_frame_formats(args.frame_format)
+    chunks = queue.Queue()
+    stop = threading.Event()
+    raw = None
+
+    if args.input:
+        thread = threading.Thread(target=file_reader, args=(args.input, chunks, stop))
+        ser = None
+    else:
+        import serial # Only needed when capturing
+        ser = serial.Serial(args.port, args.baud, timeout=READ_TIMEOUT)
+        if args.raw:
+            raw = open_raw(args.raw, "ab")
+        thread = threading.Thread(target=reader, args=(ser, chunks, stop, raw))
+        print("Capturing from {} at {} baud into {}. Press Ctrl+C to stop.".format(args.port, args.baud, args.output), file=sys.stderr)
+
+    stats = new_stats()
+    stop_on_interrupt(stop)
+    thread.start()
+    capture(chunks, decoder, logger, frame_formats, stats, not args.quiet)
+    stop.set()
+    thread.join()
+    if ser is not None:
+        ser.close()
+    if raw is not None:
+        raw.close()
+    logging.shutdown()
+
+    summary = "Received {} bytes, {} lines and {} frames ({} crc errors).".format(
+        stats["bytes"], stats["lines"], stats["frames"], stats["crc_errors"])
+    if not args.input: # A replay is read as fast as possible, so the backlog means nothing
+        summary += " Largest backlog was {} chunks.".format(stats["largest_backlog"])
+    print(summary, file=sys.stderr)
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""Checks the "Variables read", "Variables modified" and "Maximum stack depth used" comments at the
+start of each subroutine against what the code actually does.
+
+Variables are compared by the bytes they are stored in, so writing to a word modifies both of its
+bytes and an alias documented under a different name is still matched. "Variables read" are the
+variables that may be read before being written (the inputs to the subroutine). gosub adds one
+to the stack depth while goto and dropping through into the next label do not.
+
+The tightest contract that is still correct is suggested for each subroutine that differs, so
+that callers can rely on variables that are not modified instead of saving them first.
+
+Limitations:
+ - A variable is only counted as always written if it is written in every branch of an if or
+   select block. for and do ... loop blocks are assumed to run at least once.
+ - Copying a variable somewhere and back again before returning (for example
+   "s_transfer_storage = param1" ... "param1 = s_transfer_storage") is not counted as modifying
+   it, as long as the copy back is not inside a block.
+ - Without --define, code in every #IF branch is included. With --define, #IFDEF and #IFNDEF are
+   evaluated and any other #IF is still included.
+ - Macros are not expanded.
+
+Usage:
+    contracts.py "../LoRa and PJON/Transmit.bas"
+    contracts.py --define ENABLE_LORA_TRANSMIT --all "../LoRa and PJON/include/LoRa.basinc"
+"""
+from __future__ import annotations
+from typing import Dict, List, Set, Tuple
+import argparse
+import os
+import re
+import sys
+
+from variable_count import get_workingline, title, highlight, highlight2, bold
+
+BYTE_VARIABLES = 28 # b0 to b27 on M2 parts
+TOKEN = re.compile(r"(?<![\w.%$])@?[A-Za-z_]\w*")
+STRING = re.compile(r'"[^"]*"')
+CONTRACT = re.compile(r"^\s*[;']\s*(Variables read|Variables modified|Maximum stack depth used)\s*:(.*)$", re.IGNORECASE)
+CONTINUATION = re.compile(r"^\s*[;']\s{2,}([\w@]+\s*,\s*)*[\w@]+\s*,?\s*$")
+TERMINATORS = ["return", "reset", "stop", "goto"]
+ALL_STORAGE = [f"b{byte}" for byte in range(BYTE_VARIABLES)] + ["bptr", "@bptr"]
+
+# Commands that write to some of their arguments: index of the first argument that is written
+OUTPUT_ARGUMENTS = {
+    "readtable": 1, "read": 1, "readadc": 1, "readadc10": 1, "peek": 1, "peeksfr": 1,
+    "pulsin": 2, "count": 2, "readtemp": 1, "readtemp12": 1, "bintoascii": 1, "bintobcd": 1,
+    "bcdtobin": 1, "touch": 1, "touch16": 1, "calibadc": 0, "calibadc10": 0, "readsilicon": 0,
+    "readdac": 0, "readdac10": 0, "serrxd": 0, "random": 0, "readinternaltemp": 2, "srlatch": 99,
+}
+PARENTHESES_WRITTEN = ["hi2cin", "readi2c", "serin"] # Variables in brackets are written
+
+def storage(name:str) -> List[str] | None:
+    """Returns the bytes a raw variable name is stored in, or None if it is not a variable."""
+    name = name.lower()
+    if re.fullmatch(r"b\d+", name) and int(name[1:]) < BYTE_VARIABLES:
+        return [name]
+    if re.fullmatch(r"w\d+", name) and int(name[1:]) < BYTE_VARIABLES // 2:
+        return [f"b{int(name[1:]) * 2}", f"b{int(name[1:]) * 2 + 1}"]
+    if name == "bptr":
+        return ["bptr"]
+    if name in ("@bptr", "@bptrinc", "@bptrdec"):
+        return ["@bptr"]
+    return None
+
+def storage_order(byte:str) -> Tuple[int, str]:
+    return (int(byte[1:]), "") if re.fullmatch(r"b\d+", byte) else (BYTE_VARIABLES, byte)
+
+class Event:
+    """Something a subroutine does that matters for its contract, in the order it happens.
+    kind is one of:
+     - "read", "write": names are the variables.
+     - "copy": names are [destination, source] for a plain copy (also has a write event).
+     - "gosub", "goto", "drop": names is the label. conditional is True for if ... then label
+       and on ... goto.
+     - "open", "branch", "close": the start of an if, select or loop block, the start of another
+       branch in it (else, elseif, case) and the end. conditional is True on "open" if the block
+       might not run and on "branch" for else / case else.
+     - "return": a return inside a block."""
+    def __init__(self, kind:str, names:List[str] | str=None, conditional:bool=False):
+        self.kind = kind
+        self.names = names
+        self.conditional = conditional
+
+class Subroutine:
+    def __init__(self, name:str, filename:str, line:int):
+        self.name = name
+        self.filename = filename
+        self.line = line
+        self.events: List[Event] = []
+        self.contract: Dict[str, List[str] | int] = {}
+        # Computed
+        self.inputs: Set[str] = set()
+        self.modified: Set[str] = set()
+        self.must_write: Set[str] = set() # Always written before returning
+        self.depth = 0
+
+class Program:
+    def __init__(self, defines:List[str] | None=None):
+        self.aliases: Dict[str, List[str]] = {} # Lower case symbol: bytes
+        self.names: Dict[str, str] = {} # Lower case name: name as first used
+        self.name_order: List[str] = [] # Lower case names of variables in the order first used
+        self.subroutines: Dict[str, Subroutine] = {}
+        self.order: List[Subroutine] = []
+        self.evaluate = defines is not None # Only evaluate #IFDEF if defines were given
+        self.defines = set(name.lower() for name in defines or [])
+        self.warnings: List[str] = []
+
+    # Parsing
+    def resolve(self, name:str) -> List[str] | None:
+        """Returns the bytes a variable or symbol is stored in, or None if it is not a variable."""
+        raw = storage(name)
+        if raw is not None:
+            return raw
+        return self.aliases.get(name.lower())
+
+    def use(self, name:str) -> None:
+        """Remembers the order names are used in so that suggested contracts look familiar."""
+        lower = name.lower()
+        if lower not in self.names:
+            self.names[lower] = name
+            self.name_order.append(lower)
+
+    def variables(self, text:str) -> List[str]:
+        """Returns the variables used in a piece of code."""
+        found = []
+        for match in TOKEN.finditer(text):
+            if self.resolve(match.group(0)) is not None:
+                self.use(match.group(0))
+                found.append(match.group(0))
+        return found
+
+    def parse(self, filename:str, base:str | None=None) -> None:
+        """Reads a file and the files it includes (relative to the first file like picaxe.py)."""
+        base = base if base is not None else os.path.dirname(os.path.abspath(filename))
+        with open(filename, "r", errors="replace") as file:
+            lines = file.readlines()
+
+        conditions = [] # Stack of (active, unknown) for #IF blocks
+        nesting = 0
+        current = None
+        terminated = False
+        for number, line in enumerate(lines):
+            workingline = STRING.sub('""', get_workingline(line))
+            lower = workingline.lower()
+            words = lower.replace(",", " ").split()
+
+            # Preprocessor
+            if lower.startswith("#"):
+                self.directive(words, get_workingline(line), conditions, base, filename)
+                continue
+            if not all(active for active, _ in conditions):
+                continue
+
+            contract = CONTRACT.match(line)
+            if contract is not None and current is not None:
+                self.add_contract(current, contract, lines, number)
+                continue
+            if not lower:
+                continue
+
+            if words[0] == "symbol" and "=" in workingline:
+                name, _, value = workingline[6:].partition("=")
+                resolved = self.resolve(value.split()[0]) if value.split() else None
+                if resolved is not None:
+                    self.aliases[name.strip().lower()] = resolved
+                continue
+
+            label = workingline.split(":")[0].strip()
+            if ":" in workingline and label.isidentifier():
+                subroutine = Subroutine(label, filename, number)
+                if current is not None and not terminated:
+                    current.events.append(Event("drop", label))
+                if label.lower() in self.subroutines:
+                    self.warnings.append(f"{filename}:{number + 1}: '{label}' is defined more than once")
+                self.subroutines[label.lower()] = subroutine
+                self.order.append(subroutine)
+                current = subroutine
+                terminated = False
+                nesting = 0
+                workingline = workingline.split(":", 1)[1].strip()
+                lower = workingline.lower()
+                words = lower.replace(",", " ").split()
+                if not words:
+                    continue
+
+            if current is None or terminated:
+                continue # Code before the first label or unreachable until the next label
+            nesting += self.statement(current, workingline, lower, words, nesting)
+            if nesting <= 0 and (words[0] in TERMINATORS or words == ["end"]):
+                terminated = True
+
+    def directive(self, words:List[str], workingline:str, conditions:List, base:str, filename:str) -> None:
+        """Handles #INCLUDE, #DEFINE and #IF blocks."""
+        command = words[0]
+        active = all(active for active, _ in conditions)
+        if command == "#include" and active:
+            parts = workingline.split('"')
+            if len(parts) >= 3 and parts[1]:
+                path = os.path.join(base, parts[1])
+                if os.path.exists(path):
+                    self.parse(path, base)
+                else:
+                    self.warnings.append(f"{filename}: could not find '{parts[1]}' to include")
+        elif command == "#define" and active and len(words) > 1:
+            self.defines.add(words[1])
+        elif command in ("#ifdef", "#ifndef") and self.evaluate:
+            found = len(words) > 1 and words[1] in self.defines
+            conditions.append((found == (command == "#ifdef"), False))
+        elif command in ("#if", "#ifdef", "#ifndef"):
+            conditions.append((True, True)) # Unknown, include everything
+        elif command in ("#else", "#elseif", "#elseifdef", "#elseifndef") and conditions:
+            previous, unknown = conditions.pop()
+            conditions.append((True if unknown else not previous, unknown))
+        elif command == "#endif" and conditions:
+            conditions.pop()
+
+    def add_contract(self, subroutine:Subroutine, match, lines:List[str], number:int) -> None:
+        """Reads a contract comment, including any continuation lines after it."""
+        kind = match.group(1).lower()
+        text = match.group(2)
+        following = number + 1
+        while following < len(lines) and CONTINUATION.match(lines[following]) and not CONTRACT.match(lines[following]):
+            text += "," + lines[following].strip().lstrip(";'")
+            following += 1
+        if kind == "maximum stack depth used":
+            digits = re.findall(r"\d+", text)
+            subroutine.contract[kind] = int(digits[0]) if digits else None
+        else:
+            names = [name.strip() for name in text.split(",") if name.strip()]
+            subroutine.contract[kind] = [] if [name.lower() for name in names] == ["none"] else names
+
+    def statement(self, subroutine:Subroutine, workingline:str, lower:str, words:List[str], nesting:int) -> int:
+        """Works out what a single line reads, writes and calls. Returns the change in nesting."""
+        events = subroutine.events
+        command = words[0]
+
+        def read(text:str) -> None:
+            names = self.variables(text)
+            if names:
+                events.append(Event("read", names))
+            for name in names:
+                if name.lower() in ("@bptrinc", "@bptrdec"):
+                    events.append(Event("read", ["bptr"]))
+                    events.append(Event("write", ["bptr"]))
+
+        def write(text:str) -> None:
+            names = self.variables(text)
+            for name in names:
+                if name.lower() in ("@bptrinc", "@bptrdec"):
+                    events.append(Event("read", ["bptr"]))
+                    events.append(Event("write", ["bptr"]))
+                elif name.lower() == "@bptr":
+                    events.append(Event("read", ["bptr"]))
+            if names:
+                events.append(Event("write", names))
+
+        # Control flow
+        if command == "gosub" and len(words) > 1:
+            events.append(Event("gosub", words[1]))
+        elif command == "goto" and len(words) > 1:
+            events.append(Event("goto", words[1]))
+        elif command == "return":
+            if nesting > 0:
+                events.append(Event("return"))
+        elif command == "on" and ("gosub" in words or "goto" in words):
+            kind = "gosub" if "gosub" in words else "goto"
+            position = words.index(kind)
+            read(" ".join(words[1:position]))
+            for target in words[position + 1:]:
+                events.append(Event(kind, target, True))
+        elif command in ("if", "elseif") and words[-1] != "then" and "then" in words:
+            # Single line if with a label after then
+            read(lower.split("then")[0])
+            events.append(Event("goto", words[-1], True))
+        elif command == "if" or command == "select":
+            read(lower)
+            events.append(Event("open", conditional=True))
+            return 1
+        elif command in ("elseif", "else", "case"):
+            is_else = command == "else" or words[1:2] == ["else"]
+            events.append(Event("branch", conditional=is_else))
+            read(lower) # The condition is evaluated in the new branch
+        elif command in ("endif", "endselect") or (command == "end" and words[1:2] in (["if"], ["select"])):
+            events.append(Event("close"))
+            return -1
+        elif command == "do":
+            events.append(Event("open", conditional=len(words) > 1)) # do while / do until may not run at all
+            read(lower)
+            return 1
+        elif command == "loop":
+            read(lower)
+            events.append(Event("close"))
+            return -1
+        elif command == "for":
+            variable, _, rest = lower[3:].partition("=")
+            read(rest)
+            write(variable)
+            events.append(Event("open"))
+            return 1
+        elif command == "next":
+            if len(words) > 1:
+                read(words[1])
+                write(words[1])
+            events.append(Event("close"))
+            return -1
+        elif command in ("inc", "dec") and len(words) > 1:
+            read(words[1])
+            write(words[1])
+        elif command in OUTPUT_ARGUMENTS:
+            arguments = [argument.strip(" ()") for argument in workingline[len(command):].split(",")]
+            first = OUTPUT_ARGUMENTS[command]
+            if command == "random":
+                read(",".join(arguments))
+            read(",".join(arguments[:first]))
+            write(",".join(arguments[first:]))
+        elif command in PARENTHESES_WRITTEN:
+            inside = re.findall(r"\(([^)]*)\)", workingline)
+            outside = re.sub(r"\([^)]*\)", "", workingline[len(command):])
+            read(outside)
+            write(",".join(inside[-1:]))
+            read(",".join(inside[:-1]))
+        elif "=" in workingline:
+            # Assignment
+            target, _, expression = workingline.partition("=")
+            target = target.strip()
+            if target.lower().startswith("let "):
+                target = target[4:].strip()
+            read(expression)
+            write(target)
+            source = expression.strip()
+            if self.resolve(target) is not None and self.resolve(source) is not None and len(self.resolve(target)) == len(self.resolve(source)):
+                events.append(Event("copy", [target, source]))
+        else:
+            read(workingline[len(command):])
+        return 0
+
+    # Analysis
+    def analyse(self) -> None:
+        """Works out the inputs, modified variables and stack depth of every subroutine."""
+        for subroutine in self.order:
+            for event in subroutine.events:
+                if event.kind in ("gosub", "goto", "drop") and event.names.lower() not in self.subroutines:
+                    self.warnings.append(f"{subroutine.filename}: '{subroutine.name}' calls '{event.names}', which was not found")
+
+        # Subroutines can depend on each other through loops, so repeat until nothing changes
+        for _ in range(len(self.order) * 4 + 4):
+            changed = False
+            for subroutine in self.order:
+                result = self.flow(subroutine)
+                changed |= result != (subroutine.inputs, subroutine.modified, subroutine.must_write)
+                subroutine.inputs, subroutine.modified, subroutine.must_write = result
+            if not changed:
+                break
+
+        # Stack depth as the longest path, where a cycle through a gosub is unbounded recursion
+        for _ in range(len(self.order) + 1):
+            changed = False
+            for subroutine in self.order:
+                depth = subroutine.depth
+                for event in subroutine.events:
+                    target = self.subroutines.get(event.names.lower()) if isinstance(event.names, str) else None
+                    if target is not None:
+                        depth = max(depth, target.depth + (event.kind == "gosub"))
+                if depth != subroutine.depth:
+                    subroutine.depth = depth
+                    changed = True
+            if not changed:
+                break
+        else:
+            for subroutine in self.order:
+                subroutine.depth = None # Recursion
+            self.warnings.append("Recursion found, so stack depths cannot be worked out")
+
+    def bytes_of(self, names:List[str]) -> Set[str]:
+        result = set()
+        for name in names:
+            result.update(self.resolve(name) or [])
+        return result
+
+    def flow(self, subroutine:Subroutine) -> Tuple[Set[str], Set[str], Set[str]]:
+        """Steps through the events using what is already known about other subroutines.
+        Returns the bytes that may be read before being written, the bytes that may be changed
+        on return and the bytes that are always written."""
+        inputs = set()
+        modified = set()
+        written = set() # Bytes that have always been written by this point
+        unchanged = None # Bytes that definitely hold the value they had on entry, None for all
+        holds = {} # Byte: byte whose entry value it holds
+        blocks = [] # (written at the start, written at the end of each branch, has else, may not run)
+        exits = [] # Bytes written when returning early
+
+        def changed(bytes_set:Set[str]) -> None:
+            nonlocal unchanged
+            unchanged = (set(ALL_STORAGE) if unchanged is None else unchanged) - bytes_set
+            for byte in bytes_set:
+                holds.pop(byte, None)
+
+        for event in subroutine.events:
+            if event.kind == "read":
+                inputs |= self.bytes_of(event.names) - written
+            elif event.kind == "write":
+                modified |= self.bytes_of(event.names)
+                written |= self.bytes_of(event.names)
+                changed(self.bytes_of(event.names))
+            elif event.kind == "copy":
+                destination, source = [self.resolve(name) for name in event.names]
+                for to, original in zip(destination, source):
+                    original = holds.get(original, original if unchanged is None or original in unchanged else None)
+                    if original == to and not blocks:
+                        unchanged.add(to) # Restored
+                    elif original is not None:
+                        holds[to] = original
+            elif event.kind == "open":
+                blocks.append((set(written), [], False, event.conditional))
+                holds.clear()
+            elif event.kind == "branch":
+                start, ends, has_else, conditional = blocks[-1]
+                ends.append(written)
+                blocks[-1] = (start, ends, has_else or event.conditional, conditional)
+                written = set(start)
+                holds.clear()
+            elif event.kind == "close" and blocks:
+                start, ends, has_else, conditional = blocks.pop()
+                if ends and has_else:
+                    written = set.intersection(written, *ends)
+                elif ends or conditional:
+                    written = start # No else, so possibly none of the branches ran
+                holds.clear()
+            elif event.kind == "return":
+                exits.append(set(written))
+            else:
+                target = self.subroutines.get(event.names.lower())
+                if target is None:
+                    continue
+                inputs |= target.inputs - written
+                modified |= target.modified
+                changed(target.modified)
+                if not event.conditional:
+                    written |= target.must_write
+                if event.kind == "goto" and event.conditional:
+                    exits.append(written | target.must_write) # Might not come back
+
+        written = written.intersection(*exits)
+        if unchanged is not None:
+            written -= unchanged
+            if not exits:
+                modified -= unchanged
+        return inputs, modified, written
+
+
+    def names_for(self, bytes_set:Set[str]) -> List[str]:
+        """Covers the bytes with the names used in the code, preferring words over their bytes."""
+        remaining = set(bytes_set)
+        chosen = []
+        candidates = sorted(self.name_order, key=lambda name: -len(self.resolve(name) or []))
+        for name in candidates:
+            covers = set(self.resolve(name) or [])
+            if covers and covers <= remaining and name not in ("@bptrinc", "@bptrdec"):
+                chosen.append(name)
+                remaining -= covers
+        chosen.extend(sorted(remaining, key=storage_order))
+        chosen.sort(key=lambda name: self.name_order.index(name) if name in self.name_order else len(self.name_order))
+        return [self.names.get(name, name) for name in chosen]
+
+    def check(self, subroutine:Subroutine) -> Dict[str, Dict]:
+        """Compares the contract with the computed values. Returns the differences."""
+        problems = {}
+        for kind, computed in (("variables read", subroutine.inputs), ("variables modified", subroutine.modified)):
+            if kind not in subroutine.contract:
+                continue
+            documented = subroutine.contract[kind]
+            unknown = [name for name in documented if self.resolve(name) is None]
+            documented_bytes = self.bytes_of(documented)
+            if kind == "variables read" and "bptr" in documented_bytes | computed:
+                # Reading bptr covers reading what it points to
+                computed = computed - {"@bptr"}
+                documented_bytes.discard("@bptr")
+            missing = computed - documented_bytes
+            extra = documented_bytes - computed
+            if missing or extra or unknown:
+                problems[kind] = {"missing": self.names_for(missing), "extra": self.names_for(extra), "unknown": unknown}
+
+        kind = "maximum stack depth used"
+        if kind in subroutine.contract and subroutine.contract[kind] != subroutine.depth:
+            problems[kind] = {"documented": subroutine.contract[kind], "computed": subroutine.depth}
+        return problems
+
+    def proposal(self, subroutine:Subroutine) -> List[str]:
+        """The tightest contract for the subroutine as comment lines."""
+        inputs = subroutine.inputs - {"@bptr"} if "bptr" in subroutine.inputs else subroutine.inputs
+        read = ", ".join(self.names_for(inputs)) or "none"
+        modified = ", ".join(self.names_for(subroutine.modified)) or "none"
+        depth = "unknown (recursion)" if subroutine.depth is None else subroutine.depth
+        return [f"; Variables read: {read}", f"; Variables modified: {modified}", f"; Maximum stack depth used: {depth}"]
+
+def report(program:Program, show_all:bool=False) -> int:
+    """Prints the differences for each subroutine with a contract. Returns the number that are
+    unsafe (something is modified or read that is not documented or the stack is deeper)."""
+    unsafe = 0
+    checked = 0
+    for subroutine in program.order:
+        if not subroutine.contract:
+            continue
+        checked += 1
+        problems = program.check(subroutine)
+        if not problems and not show_all:
+            continue
+
+        is_unsafe = any(problem.get("missing") for problem in problems.values())
+        depth = problems.get("maximum stack depth used")
+        if depth is not None and (depth["documented"] is None or depth["computed"] is None or depth["computed"] > depth["documented"]):
+            is_unsafe = True
+        unsafe += is_unsafe
+
+        status = highlight2("UNSAFE") if is_unsafe else ("could be tighter" if problems else "ok")
+        print(f"{bold(subroutine.name)} ({os.path.relpath(subroutine.filename)}:{subroutine.line + 1}): {status}")
+        for kind, problem in problems.items():
+            if "documented" in problem:
+                print(f"    {kind.capitalize()}: documented {problem['documented']}, actually {problem['computed']}")
+                continue
+            if problem["missing"]:
+                print(f"    {kind.capitalize()}: not documented: {highlight(', '.join(problem['missing']))}")
+            if problem["extra"]:
+                print(f"    {kind.capitalize()}: documented but not needed: {', '.join(problem['extra'])}")
+            if problem["unknown"]:
+                print(f"    {kind.capitalize()}: not variables: {', '.join(problem['unknown'])}")
+        if problems:
+            print("    Suggested contract:")
+            for line in program.proposal(subroutine):
+                print(f"    {line}")
+        print()
+
+    print(f"Checked {checked} contracts, {unsafe} unsafe")
+    return unsafe
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the variables and stack depth documented for each subroutine.")
+    parser.add_argument("files", nargs="+", help="Program or library files. #INCLUDEs are followed")
+    parser.add_argument("--define", action="append", help="Evaluate #IFDEF and #IFNDEF with this defined. Can be given more than once")
+    parser.add_argument("--all", action="store_true", help="Show subroutines whose contracts are correct as well")
+    args = parser.parse_args()
+
+    program = Program(args.define)
+    base = os.path.dirname(os.path.abspath(args.files[0]))
+    for filename in args.files:
+        program.parse(filename, base)
+    program.analyse()
+
+    for warning in program.warnings:
+        print(title(f"Warning: {warning}"))
+    if program.warnings:
+        print()
+    sys.exit(1 if report(program, args.all) else 0)
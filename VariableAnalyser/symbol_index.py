@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Index of the symbols, defines, macros, labels and call sites in a PICAXE BASIC project.
+
+The index is saved to a cache file (in the user's cache folder by default, so that it is not
+committed with the project) and only files that have changed since the last run are parsed
+again, so lookups on large include trees are quick. It can be queried from the command line or
+used by an editor as a small language server over stdio (JSON-RPC with Content-Length headers).
+
+Examples:
+    symbol_index.py def PACKET_RX_START
+    symbol_index.py callers read_register
+    symbol_index.py --root "../LoRa and PJON" refs param1
+    symbol_index.py serve
+"""
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import unquote, urlparse
+from urllib.request import pathname2url
+
+from variable_count import get_workingline
+
+CACHE_VERSION = 1
+CACHE_FOLDER = "picaxe_symbol_index"
+EXTENSIONS = (".bas", ".basinc")
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+STRING = re.compile(r'"[^"]*"')
+CALL = re.compile(r"\b(gosub|goto)\s+([a-z_][a-z0-9_,\s]*)")
+THEN_LABEL = re.compile(r"\bthen\s+([a-z_][a-z0-9_]*)\s*$")
+KIND_ORDER = ["label", "macro", "define", "symbol"]
+
+def code_part(line:str) -> str:
+    """Returns the line without comments or strings, keeping the columns the same."""
+    code = line.rstrip("\r\n").replace("'", ";").split(";")[0]
+    return STRING.sub(lambda match: " " * len(match.group(0)), code)
+
+def get_label(workingline:str) -> str | None:
+    """Returns the label on the line if there is one (same rule as variable_count.py)."""
+    label = workingline.split(":")[0].strip()
+    if ":" in workingline and label.isidentifier():
+        return label
+    return None
+
+def parse_file(path:str) -> Dict:
+    """Finds everything defined, referenced and called in a single file."""
+    definitions = [] # [name, kind, line, column, text]
+    references: Dict[str, List[List[int]]] = {} # lower case name: [[line, column], ...]
+    calls = [] # [target, kind, line, caller]
+    includes = []
+    caller = f"Start of {os.path.basename(path)}"
+
+    with open(path, "r", errors="replace") as file:
+        for number, line in enumerate(file):
+            workingline = get_workingline(line)
+            lower = workingline.lower()
+            if not lower:
+                continue
+
+            defined = None
+            words = lower.split()
+            if lower.startswith("#include"):
+                parts = workingline.split('"')
+                if len(parts) >= 3:
+                    includes.append(parts[1])
+                continue
+            elif words[0] == "symbol" and len(words) >= 2:
+                defined = (workingline.split()[1].split("=")[0], "symbol")
+            elif words[0] == "#define" and len(words) >= 2:
+                defined = (workingline.split()[1], "define")
+            elif words[0] == "#macro" and len(words) >= 2:
+                defined = (workingline.split()[1].split("(")[0], "macro")
+            else:
+                label = get_label(workingline)
+                if label is not None:
+                    defined = (label, "label")
+                    caller = label
+
+            code = code_part(line)
+            skip = None
+            if defined is not None:
+                column = code.find(defined[0])
+                definitions.append([defined[0], defined[1], number, max(column, 0), line.strip()])
+                skip = column
+
+            for match in IDENTIFIER.finditer(code):
+                if match.start() != skip:
+                    references.setdefault(match.group(0).lower(), []).append([number, match.start()])
+
+            code_lower = code.lower().strip()
+            for kind, targets in CALL.findall(code_lower):
+                for name in targets.split(","): # on ... gosub a, b, c
+                    if name.strip():
+                        calls.append([name.strip().split()[0], kind, number, caller])
+            match = THEN_LABEL.search(code_lower)
+            if match is not None and "gosub" not in code_lower and "goto" not in code_lower:
+                calls.append([match.group(1), "goto", number, caller])
+
+    return {"definitions": definitions, "references": references, "calls": calls, "includes": includes}
+
+def default_cache(root:str) -> str:
+    """Returns the cache file for a project, in the user's cache folder and named after the project's path."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser(os.path.join("~", ".cache")))
+    name = hashlib.sha256(os.path.abspath(root).encode()).hexdigest()[:16]
+    return os.path.join(base, CACHE_FOLDER, f"{os.path.basename(os.path.abspath(root))}-{name}.json")
+
+def file_hash(path:str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+class SymbolIndex:
+    """Persistent index of every PICAXE BASIC file under a folder."""
+    def __init__(self, root:str, cache:str | None=None):
+        self.root = os.path.abspath(root)
+        self.cache = cache if cache is not None else default_cache(self.root)
+        self.files: Dict[str, Dict] = {} # Path relative to root: entry
+        self._lookup = None # Built from files when first needed
+        self._touched = False # Times changed without the contents changing, so worth saving
+        self.load()
+
+    def load(self) -> None:
+        """Loads the cache if there is one for this version."""
+        try:
+            with open(self.cache) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.files = data["files"]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache)), exist_ok=True)
+        with open(self.cache, "w") as file:
+            json.dump({"version": CACHE_VERSION, "files": self.files}, file)
+
+    def find_files(self) -> List[str]:
+        """Returns every source file under the root, relative to it."""
+        found = []
+        for directory, folders, files in os.walk(self.root):
+            folders[:] = [folder for folder in folders if not folder.startswith(".")]
+            for name in files:
+                if name.lower().endswith(EXTENSIONS):
+                    found.append(os.path.relpath(os.path.join(directory, name), self.root))
+        return sorted(found)
+
+    def update_file(self, relative:str) -> bool:
+        """Parses the file again if it has changed. Returns True if the index changed."""
+        path = os.path.join(self.root, relative)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if relative in self.files:
+                del self.files[relative]
+                self._lookup = None
+                return True
+            return False
+
+        entry = self.files.get(relative)
+        if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return False # Unchanged
+        digest = file_hash(path)
+        if entry is not None and entry["sha256"] == digest:
+            # Touched but the contents are the same
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            self._touched = True
+            return False
+
+        entry = parse_file(path)
+        entry.update({"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest})
+        self.files[relative] = entry
+        self._lookup = None
+        return True
+
+    def update(self) -> Tuple[int, int]:
+        """Brings the whole index up to date. Returns the number of files parsed and removed."""
+        current = self.find_files()
+        removed = [relative for relative in self.files if relative not in current]
+        for relative in removed:
+            del self.files[relative]
+        parsed = sum(self.update_file(relative) for relative in current)
+        if parsed or removed or self._touched:
+            self._lookup = None
+            self._touched = False
+            self.save()
+        return parsed, len(removed)
+
+    def lookup(self) -> Dict[str, Dict]:
+        """Tables of definitions, references and calls by lower case name."""
+        if self._lookup is None:
+            lookup = {"definitions": {}, "references": {}, "calls": {}, "callees": {}}
+            for relative, entry in self.files.items():
+                for name, kind, line, column, text in entry["definitions"]:
+                    lookup["definitions"].setdefault(name.lower(), []).append(
+                        {"name": name, "kind": kind, "file": relative, "line": line, "column": column, "text": text})
+                for name, positions in entry["references"].items():
+                    lookup["references"].setdefault(name, []).extend((relative, line, column) for line, column in positions)
+                for target, kind, line, caller in entry["calls"]:
+                    call = {"target": target, "kind": kind, "file": relative, "line": line, "caller": caller}
+                    lookup["calls"].setdefault(target, []).append(call)
+                    lookup["callees"].setdefault(caller.lower(), []).append(call)
+            for definitions in lookup["definitions"].values():
+                definitions.sort(key=lambda item: KIND_ORDER.index(item["kind"]))
+            self._lookup = lookup
+        return self._lookup
+
+    def definitions(self, name:str) -> List[Dict]:
+        return self.lookup()["definitions"].get(name.lower(), [])
+
+    def references(self, name:str) -> List[Tuple[str, int, int]]:
+        return self.lookup()["references"].get(name.lower(), [])
+
+    def callers(self, name:str) -> List[Dict]:
+        return self.lookup()["calls"].get(name.lower(), [])
+
+    def callees(self, name:str) -> List[Dict]:
+        return self.lookup()["callees"].get(name.lower(), [])
+
+    def search(self, prefix:str) -> List[Dict]:
+        """Every definition starting with prefix (case insensitive)."""
+        prefix = prefix.lower()
+        return [definition for name, definitions in sorted(self.lookup()["definitions"].items())
+                if name.startswith(prefix) for definition in definitions]
+
+    def includes(self, relative:str) -> List[str]:
+        entry = self.files.get(os.path.normpath(relative))
+        return entry["includes"] if entry is not None else []
+
+    def line_text(self, relative:str, line:int, strip:bool=True) -> str:
+        try:
+            with open(os.path.join(self.root, relative), errors="replace") as file:
+                for number, text in enumerate(file):
+                    if number == line:
+                        return text.strip() if strip else text
+        except OSError:
+            pass
+        return ""
+
+# Language server
+def read_message(stream) -> Dict | None:
+    """Reads a JSON-RPC message with a Content-Length header. Returns None at the end."""
+    length = None
+    while True:
+        header = stream.readline()
+        if not header:
+            return None
+        header = header.decode("ascii").strip()
+        if not header:
+            break
+        name, _, value = header.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    if length is None:
+        return None
+    return json.loads(stream.read(length).decode("utf-8"))
+
+def write_message(stream, message:Dict) -> None:
+    body = json.dumps(message).encode("utf-8")
+    stream.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+    stream.flush()
+
+class Server:
+    """Answers a subset of the language server protocol plus a few extra methods."""
+    def __init__(self, index:SymbolIndex):
+        self.index = index
+        self.running = True
+        self.methods = {
+            "initialize": self.initialize,
+            "shutdown": lambda params: None,
+            "textDocument/definition": self.definition,
+            "textDocument/references": self.references,
+            "workspace/symbol": self.workspace_symbol,
+            "picaxe/definitions": lambda params: self.index.definitions(params["name"]),
+            "picaxe/callers": lambda params: self.index.callers(params["name"]),
+            "picaxe/callees": lambda params: self.index.callees(params["name"]),
+            "picaxe/references": lambda params: [{"file": f, "line": l, "column": c} for f, l, c in self.index.references(params["name"])],
+        }
+
+    def relative(self, uri:str) -> str:
+        return os.path.relpath(unquote(urlparse(uri).path), self.index.root)
+
+    def uri(self, relative:str) -> str:
+        return "file://" + pathname2url(os.path.join(self.index.root, relative))
+
+    def location(self, relative:str, line:int, column:int, length:int) -> Dict:
+        return {"uri": self.uri(relative), "range": {"start": {"line": line, "character": column},
+                                                     "end": {"line": line, "character": column + length}}}
+
+    def word_at(self, params:Dict) -> str | None:
+        """Returns the identifier at the position in the request."""
+        relative = self.relative(params["textDocument"]["uri"])
+        if self.index.update_file(relative):
+            self.index.save()
+        position = params["position"]
+        line = self.index.line_text(relative, position["line"], strip=False)
+        for match in IDENTIFIER.finditer(line):
+            if match.start() <= position["character"] <= match.end():
+                return match.group(0)
+        return None
+
+    def initialize(self, params:Dict) -> Dict:
+        self.index.update()
+        return {"capabilities": {"definitionProvider": True, "referencesProvider": True,
+                                 "workspaceSymbolProvider": True,
+                                 "textDocumentSync": {"openClose": False, "save": True}},
+                "serverInfo": {"name": "picaxe-symbol-index"}}
+
+    def definition(self, params:Dict) -> List[Dict]:
+        word = self.word_at(params)
+        if word is None:
+            return []
+        return [self.location(item["file"], item["line"], item["column"], len(word))
+                for item in self.index.definitions(word)]
+
+    def references(self, params:Dict) -> List[Dict]:
+        word = self.word_at(params)
+        if word is None:
+            return []
+        declarations = {(item["file"], item["line"]) for item in self.index.definitions(word)}
+        include = params.get("context", {}).get("includeDeclaration", True)
+        result = [self.location(f, l, c, len(word)) for f, l, c in self.index.references(word)]
+        if include:
+            result.extend(self.location(f, l, 0, 0) for f, l in declarations)
+        return result
+
+    def workspace_symbol(self, params:Dict) -> List[Dict]:
+        kinds = {"label": 12, "macro": 12, "define": 14, "symbol": 13} # Function, Constant, Variable
+        return [{"name": item["name"], "kind": kinds[item["kind"]],
+                 "location": self.location(item["file"], item["line"], item["column"], len(item["name"]))}
+                for item in self.index.search(params.get("query", ""))]
+
+    def handle(self, message:Dict) -> Dict | None:
+        method = message.get("method")
+        if method == "exit":
+            self.running = False
+            return None
+        if method == "textDocument/didSave":
+            if self.index.update_file(self.relative(message["params"]["textDocument"]["uri"])):
+                self.index.save()
+            return None
+        if "id" not in message:
+            return None # Other notifications are ignored
+
+        handler = self.methods.get(method)
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": f"Unknown method '{method}'"}}
+        try:
+            result = handler(message.get("params") or {})
+        except (KeyError, TypeError, OSError) as error:
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32602, "message": str(error)}}
+        return {"jsonrpc": "2.0", "id": message["id"], "result": result}
+
+    def serve(self, stdin=None, stdout=None) -> None:
+        stdin = stdin or sys.stdin.buffer
+        stdout = stdout or sys.stdout.buffer
+        while self.running:
+            message = read_message(stdin)
+            if message is None:
+                break
+            response = self.handle(message)
+            if response is not None:
+                write_message(stdout, response)
+
+def print_definitions(definitions:List[Dict]) -> None:
+    for item in definitions:
+        print(f"{item['file']}:{item['line'] + 1}: {item['kind']:<7} {item['text']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexes and looks up symbols, defines, macros and labels in PICAXE BASIC files.")
+    parser.add_argument("--root", default=".", help="Folder containing the project (default the current folder)")
+    parser.add_argument("--cache", help=f"Index file (default in {CACHE_FOLDER} in the user's cache folder)")
+    parser.add_argument("query", choices=["def", "refs", "callers", "callees", "search", "includes", "update", "serve"],
+                        help="What to look up, or serve to run as a language server over stdio")
+    parser.add_argument("name", nargs="?", default="", help="Name to look up (file name for includes)")
+    args = parser.parse_args()
+
+    index = SymbolIndex(args.root, args.cache)
+    if args.query == "serve":
+        Server(index).serve()
+        sys.exit()
+
+    start = time.perf_counter()
+    parsed, removed = index.update()
+    if args.query == "update":
+        print(f"Indexed {len(index.files)} files ({parsed} parsed, {removed} removed) in {(time.perf_counter() - start) * 1000:.1f}ms")
+    elif args.query == "def":
+        print_definitions(index.definitions(args.name))
+    elif args.query == "search":
+        print_definitions(index.search(args.name))
+    elif args.query == "refs":
+        for relative, line, column in index.references(args.name):
+            print(f"{relative}:{line + 1}:{column + 1}: {index.line_text(relative, line)}")
+    elif args.query in ("callers", "callees"):
+        calls = index.callers(args.name) if args.query == "callers" else index.callees(args.name)
+        for call in calls:
+            print(f"{call['file']}:{call['line'] + 1}: {call['caller']} {call['kind']} {call['target']}")
+    elif args.query == "includes":
+        for name in index.includes(args.name):
+            print(name)
@@ -265,9 +265,6 @@ class SubroutineManager:
         return "\n".join(result)
 
 
-vars = VariableManager()
-subs = SubroutineManager()
-
 def get_workingline(line:str) -> str:
     return line.replace("'", ";").split(";")[0].strip()
 
@@ -354,6 +351,9 @@ def analyse(filename:str):
                 continue_label = True
 
 if __name__ == "__main__":
+    # Only made when run so that contracts.py and symbol_index.py can import the functions above
+    vars = VariableManager()
+    subs = SubroutineManager()
     fname = "compiled_slot1.bas"
     print(title("Finding variables and subroutines"))
     find_var_subs(fname)